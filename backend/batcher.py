@@ -0,0 +1,61 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class MicroBatcher:
+	def __init__(
+		self,
+		handler: Callable[[Hashable, list], Awaitable[list]],
+		window: float = 0.02,
+		max_batch_size: int = 8,
+	):
+		self.handler = handler
+		self.window = window
+		self.max_batch_size = max_batch_size
+		self.batches: dict[Hashable, list[tuple[Any, asyncio.Future]]] = {}
+		self.timers: dict[Hashable, asyncio.TimerHandle] = {}
+		self.tasks: set[asyncio.Task] = set()
+
+	async def submit(self, key: Hashable, item):
+		loop = asyncio.get_running_loop()
+		future = loop.create_future()
+
+		batch = self.batches.setdefault(key, [])
+		batch.append((item, future))
+
+		# First item opens the window, a full batch is sent right away
+		if len(batch) >= self.max_batch_size:
+			self.flush(key)
+		elif len(batch) == 1:
+			self.timers[key] = loop.call_later(self.window, self.flush, key)
+
+		return await future
+
+	def flush(self, key: Hashable):
+		timer = self.timers.pop(key, None)
+		if timer is not None:
+			timer.cancel()
+
+		batch = self.batches.pop(key, None)
+		if batch:
+			task = asyncio.create_task(self.run(key, batch))
+			self.tasks.add(task)
+			task.add_done_callback(self.tasks.discard)
+
+	async def run(self, key: Hashable, batch: list[tuple[Any, asyncio.Future]]):
+		try:
+			results = await self.handler(key, [item for item, _ in batch])
+		except Exception as error:
+			for _, future in batch:
+				if not future.done():
+					future.set_exception(error)
+			return
+
+		# Items that failed come back as their error, only their own request fails
+		for (_, future), result in zip(batch, results):
+			if future.done():
+				continue
+			if isinstance(result, Exception):
+				future.set_exception(result)
+			else:
+				future.set_result(result)
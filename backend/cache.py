@@ -0,0 +1,177 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from PIL.Image import Image as ImageType
+
+logger = logging.getLogger('uvicorn.error')
+
+# Rows hashed at a time, so the key never needs a full copy of the pixels
+KEY_STRIP_HEIGHT = 256
+
+
+class ResultCache:
+	def __init__(
+		self,
+		max_bytes: int = 64 * 1024 * 1024,
+		directory: Path | None = None,
+		max_disk_bytes: int = 1024 * 1024 * 1024,
+		salt: str = '',
+	):
+		self.max_bytes = max_bytes
+		self.directory = directory
+		self.max_disk_bytes = max_disk_bytes
+		self.salt = salt
+		self.lock = threading.Lock()
+		self.entries: OrderedDict[str, bytes] = OrderedDict()
+		self.disk_entries: OrderedDict[str, int] = OrderedDict()
+		self.size = 0
+		self.disk_size = 0
+		self.hits = 0
+		self.disk_hits = 0
+		self.misses = 0
+
+		if self.directory is not None:
+			try:
+				self.directory.mkdir(parents=True, exist_ok=True)
+				self.load_disk_entries()
+			except OSError as error:
+				# The cache is only a shortcut, without its folder results are kept in memory
+				logger.warning(f'Result cache folder unavailable, keeping results in memory only: {error}')
+				self.directory = None
+
+	def load_disk_entries(self):
+		# Entries left by earlier runs, oldest first, so they are the first to go once over the limit
+		paths = []
+		for path in self.directory.glob('*.json'):
+			try:
+				stat = path.stat()
+			except OSError:
+				continue
+			paths.append((stat.st_mtime, path.stem, stat.st_size))
+
+		for _, key, size in sorted(paths):
+			self.disk_entries[key] = size
+			self.disk_size += size
+
+		self.remove_disk(self.evict_disk())
+
+	@staticmethod
+	def make_salt(*parts) -> str:
+		# Results depend on the code and settings that produced them, a change to any part starts a fresh cache
+		hasher = hashlib.blake2b(digest_size=20)
+		for part in parts:
+			hasher.update(part if isinstance(part, bytes) else repr(part).encode())
+			hasher.update(b'\0')
+		return hasher.hexdigest()
+
+	def make_key(self, image: ImageType, analysis_type: str) -> str:
+		hasher = hashlib.blake2b(digest_size=20)
+		hasher.update(f'{self.salt}:{analysis_type}:{image.mode}:{image.width}x{image.height}:'.encode())
+
+		# Same bytes as image.tobytes(), a strip at a time
+		for top in range(0, image.height, KEY_STRIP_HEIGHT):
+			hasher.update(image.crop((0, top, image.width, min(top + KEY_STRIP_HEIGHT, image.height))).tobytes())
+
+		return hasher.hexdigest()
+
+	def get(self, key: str):
+		with self.lock:
+			if key in self.entries:
+				self.entries.move_to_end(key)
+				self.hits += 1
+				return json.loads(self.entries[key])
+
+		if self.directory is not None:
+			try:
+				value = (self.directory / f'{key}.json').read_bytes()
+				result = json.loads(value)
+			except (OSError, ValueError):
+				pass
+			else:
+				with self.lock:
+					self.store(key, value)
+					self.disk_hits += 1
+					if key in self.disk_entries:
+						self.disk_entries.move_to_end(key)
+				return result
+
+		with self.lock:
+			self.misses += 1
+		return None
+
+	def set(self, key: str, result):
+		value = json.dumps(result).encode()
+		with self.lock:
+			self.store(key, value)
+
+		if self.directory is not None and len(value) <= self.max_disk_bytes:
+			self.store_disk(key, value)
+
+	def store_disk(self, key: str, value: bytes):
+		# Write then rename so a crash never leaves a partial entry behind
+		path = self.directory / f'{key}.json'
+		temp_path = path.with_suffix('.tmp')
+		try:
+			temp_path.write_bytes(value)
+			os.replace(temp_path, path)
+		except OSError as error:
+			# A full or read-only disk only costs the disk copy, the result itself is still returned
+			logger.warning(f'Failed to write result cache entry: {error}')
+			temp_path.unlink(missing_ok=True)
+			return
+
+		with self.lock:
+			self.disk_size += len(value) - self.disk_entries.pop(key, 0)
+			self.disk_entries[key] = len(value)
+			evicted = self.evict_disk()
+
+		self.remove_disk(evicted)
+
+	def evict_disk(self) -> list[str]:
+		evicted = []
+		while self.disk_size > self.max_disk_bytes and self.disk_entries:
+			key, size = self.disk_entries.popitem(last=False)
+			self.disk_size -= size
+			evicted.append(key)
+		return evicted
+
+	def remove_disk(self, keys: list[str]):
+		# Files are removed outside the lock, their space is already taken off the accounting
+		for key in keys:
+			try:
+				(self.directory / f'{key}.json').unlink(missing_ok=True)
+			except OSError as error:
+				logger.warning(f'Failed to remove result cache entry: {error}')
+
+	def store(self, key: str, value: bytes):
+		if len(value) > self.max_bytes:
+			return
+
+		if key in self.entries:
+			self.size -= len(self.entries.pop(key))
+
+		self.entries[key] = value
+		self.size += len(value)
+
+		while self.size > self.max_bytes:
+			_, evicted = self.entries.popitem(last=False)
+			self.size -= len(evicted)
+
+	def status(self) -> dict[str, int | bool]:
+		return {
+			'entries': len(self.entries),
+			'size': self.size,
+			'max_size': self.max_bytes,
+			'hits': self.hits,
+			'disk_hits': self.disk_hits,
+			'misses': self.misses,
+			'disk': self.directory is not None,
+			'disk_entries': len(self.disk_entries),
+			'disk_size': self.disk_size,
+			'max_disk_size': self.max_disk_bytes,
+		}
@@ -0,0 +1,105 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Literal
+
+from backend.profiler import current_profile
+from ocr.stages import run_profiled, run_timed
+
+
+class QueueFullError(Exception):
+	pass
+
+
+class AnalysisExecutor:
+	def __init__(
+		self,
+		mode: Literal['thread', 'process'] = 'thread',
+		max_workers: int = 1,
+		max_queue: int = 8,
+		initializer: Callable | None = None,
+		initargs: tuple = (),
+		on_timings: Callable[[list[tuple[str, float]]], None] | None = None,
+	):
+		self.mode = mode
+		self.max_workers = max_workers
+		self.max_queue = max_queue
+		self.initializer = initializer
+		self.initargs = initargs
+		self.on_timings = on_timings
+		self.pending = 0
+		self._executor: Executor | None = None
+
+	@property
+	def executor(self) -> Executor:
+		if self._executor is None:
+			match self.mode:
+				case 'thread':
+					self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='analysis')
+				case 'process':
+					# Spawn so workers load their own model instead of inheriting the web process state
+					self._executor = ProcessPoolExecutor(
+						self.max_workers,
+						mp_context=multiprocessing.get_context('spawn'),
+						initializer=self.initializer,
+						initargs=self.initargs,
+					)
+				case _:
+					raise ValueError(f'Invalid executor mode "{self.mode}"!')
+
+		return self._executor
+
+	@property
+	def capacity(self) -> int:
+		return self.max_workers + self.max_queue
+
+	@property
+	def running(self) -> int:
+		return min(self.pending, self.max_workers)
+
+	@property
+	def queued(self) -> int:
+		return self.pending - self.running
+
+	def status(self) -> dict[str, int | str]:
+		return {
+			'mode': self.mode,
+			'workers': self.max_workers,
+			'running': self.running,
+			'queued': self.queued,
+			'capacity': self.capacity,
+		}
+
+	def _release(self):
+		self.pending -= 1
+
+	def _done(self, loop: asyncio.AbstractEventLoop):
+		try:
+			loop.call_soon_threadsafe(self._release)
+		except RuntimeError:
+			# Event loop already closed during shutdown
+			pass
+
+	async def run(self, fn: Callable, *args):
+		if self.pending >= self.capacity:
+			raise QueueFullError(f'Analysis queue full ({self.pending}/{self.capacity})!')
+
+		# Count until the job itself finishes, not the awaiting request, so disconnected clients stay counted
+		loop = asyncio.get_running_loop()
+		profile = current_profile.get()
+		future = self.executor.submit(run_timed if profile is None else run_profiled, fn, *args)
+		self.pending += 1
+		future.add_done_callback(lambda _: self._done(loop))
+
+		# Stage timings are taken inside the worker and come back with the result
+		result, timings, *stats = await asyncio.wrap_future(future)
+		if self.on_timings is not None:
+			self.on_timings(timings)
+		if profile is not None:
+			profile.add(fn.__name__, timings, *stats)
+		return result
+
+	def shutdown(self):
+		if self._executor is not None:
+			self._executor.shutdown(wait=False, cancel_futures=True)
+			self._executor = None
@@ -1,24 +1,113 @@
-from io import BytesIO
-from typing import Tuple
+from typing import IO, Tuple
 
-from PIL import Image, ImageChops
+from PIL import Image
 from PIL.Image import Image as ImageType
 
+MAX_IMAGE_SIDE = 4096
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff', '.webp'}
 
-def convert_to_jpeg(image: ImageType):
-	with BytesIO() as mem:
-		image = image.convert(mode='RGB')
-		image.save(mem, format='JPEG')
-		image = Image.open(mem)
-		return image.copy()
+
+class ImageTooLargeError(Exception):
+	pass
+
+
+def load_image(file: IO[bytes], max_side: int = MAX_IMAGE_SIDE, max_pixels: int = 0) -> ImageType:
+	image = Image.open(file)
+
+	# Size comes from the header, so oversized images are refused before any pixel is decoded
+	if max_pixels > 0 and image.width * image.height > max_pixels:
+		raise ImageTooLargeError(f'Image too large! Maximum {max_pixels} pixels!')
+
+	# Oversized JPEG is decoded straight at a smaller scale, other formats are reduced before resampling
+	if max(image.size) > max_side:
+		image.thumbnail((max_side, max_side), reducing_gap=2.0)
+
+	if image.mode != 'RGB':
+		return image.convert(mode='RGB')
+
+	image.load()
+	return image
 
 
 def crop_image(image: ImageType, colour: Tuple[int, int, int] = (255, 255, 255), threshold=50):
-	bg = Image.new(mode='RGB', size=image.size, color=colour)
-	diff = ImageChops.difference(image, bg)
-	diff = ImageChops.add(diff, diff, 2.0, -threshold)
-	bbox = diff.getbbox()
-	if bbox:
-		return image.crop(bbox)
+	# One band at a time, so the largest temporary is a single channel instead of full colour copies
+	left, upper, right, lower = image.width, image.height, 0, 0
+	found = False
+
+	for index, value in enumerate(colour):
+		mask = image.getchannel(index).point([255 if abs(level - value) > threshold else 0 for level in range(256)])
+		bbox = mask.getbbox()
+		if bbox:
+			found = True
+			left, upper = min(left, bbox[0]), min(upper, bbox[1])
+			right, lower = max(right, bbox[2]), max(lower, bbox[3])
+
+	if found:
+		return image.crop((left, upper, right, lower))
 	else:
 		return None
+
+
+def row_profile(image: ImageType) -> list[int]:
+	# Every row averaged down to a single grey level, dark rows hold content
+	return list(image.resize((1, image.height), Image.Resampling.BOX).convert(mode='L').tobytes())
+
+
+def estimate_text_height(profile: list[int], min_lines: int = 3) -> float | None:
+	background = max(profile)
+	limit = background - max(2, (background - min(profile)) * 0.1)
+
+	heights = []
+	height = 0
+	for level in [*profile, background]:
+		if level < limit:
+			height += 1
+		elif height:
+			heights.append(height)
+			height = 0
+
+	# Median line height, ignoring specks and rules that are only a row or two tall
+	heights = sorted(height for height in heights if height > 2)
+
+	# A single formula or a line or two is not a page, its height says nothing about the text size
+	if len(heights) < max(1, min_lines):
+		return None
+	return heights[len(heights) // 2]
+
+
+def scale_to_text_height(image: ImageType, text_height: int, min_scale: float = 0.75, min_lines: int = 3) -> ImageType:
+	estimated_height = estimate_text_height(row_profile(image), min_lines)
+	if estimated_height is None:
+		return image
+
+	# Only shrink, and only when it saves enough to be worth the resample
+	scale = text_height / estimated_height
+	if scale > min_scale:
+		return image
+
+	size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+	return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+
+def split_tiles(image: ImageType, tile_height: int, margin: int) -> list[ImageType]:
+	if image.height <= tile_height + margin:
+		return [image]
+
+	profile = row_profile(image)
+	tiles = []
+	top = 0
+
+	while image.height - top > tile_height + margin:
+		# Cut at the blankest row near the tile end, so lines of text are not split between tiles
+		start = top + tile_height - margin
+		end = top + tile_height + margin
+		if margin > 0:
+			cut = max(range(start, end), key=lambda row: (profile[row], -abs(row - top - tile_height)))
+		else:
+			cut = top + tile_height
+
+		tiles.append(image.crop((0, top, image.width, cut)))
+		top = cut
+
+	tiles.append(image.crop((0, top, image.width, image.height)))
+	return tiles
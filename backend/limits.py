@@ -0,0 +1,68 @@
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class RequestTooLargeError(Exception):
+	pass
+
+
+class RequestSizeLimitMiddleware:
+	def __init__(self, app: ASGIApp, max_bytes: int):
+		self.app = app
+		self.max_bytes = max_bytes
+
+	def reject(self) -> JSONResponse:
+		return JSONResponse({'error': f'Upload too large! Maximum {self.max_bytes} bytes!'}, status_code=413)
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send):
+		if scope['type'] != 'http' or self.max_bytes <= 0:
+			await self.app(scope, receive, send)
+			return
+
+		# Declared size is checked before a single byte of the body is read
+		content_length = Headers(scope=scope).get('content-length', '')
+		if content_length.isdigit() and int(content_length) > self.max_bytes:
+			await self.reject()(scope, receive, send)
+			return
+
+		received = 0
+		exceeded = False
+		started = False
+		rejected = False
+
+		# Chunked or lying uploads are counted as they stream in and cut off once over the limit
+		async def limited_receive() -> Message:
+			nonlocal received, exceeded
+			message = await receive()
+
+			if message['type'] == 'http.request':
+				received += len(message.get('body', b''))
+				if received > self.max_bytes:
+					exceeded = True
+					raise RequestTooLargeError()
+
+			return message
+
+		# Whatever the app answers to the aborted body is replaced by the 413
+		async def limited_send(message: Message):
+			nonlocal started, rejected
+			if rejected:
+				return
+
+			if exceeded and not started:
+				started = rejected = True
+				await self.reject()(scope, receive, send)
+				return
+
+			if message['type'] == 'http.response.start':
+				started = True
+			await send(message)
+
+		try:
+			await self.app(scope, limited_receive, limited_send)
+		except RequestTooLargeError:
+			pass
+
+		if exceeded and not started:
+			await self.reject()(scope, receive, send)
@@ -1,24 +1,54 @@
+import asyncio
+import importlib.metadata
+import json
 import logging
 import mimetypes
+import secrets
+import shutil
 import sys
-from contextlib import asynccontextmanager
+import zipfile
+import zlib
+from contextlib import ExitStack, asynccontextmanager
 from datetime import datetime
 from enum import Enum
 from io import BytesIO
-from pathlib import Path
-from typing import Annotated
+from pathlib import Path, PurePosixPath
+from tempfile import NamedTemporaryFile
+from typing import IO, Annotated, AsyncIterator, Awaitable, Callable, Iterator
 
 import uvicorn
-from fastapi import Cookie, Depends, FastAPI, Form, HTTPException, Request, Response, UploadFile
+from fastapi import Cookie, Depends, FastAPI, Form, Header, HTTPException, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse, StreamingResponse
+from fastapi.responses import FileResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from PIL import Image
 from sqlmodel import Session, select
 
+from backend.batcher import MicroBatcher
+from backend.cache import ResultCache
 from backend.createuser import check_password
-from backend.image_operation import convert_to_jpeg, crop_image
+from backend.executor import AnalysisExecutor, QueueFullError
+from backend.image_operation import (
+	IMAGE_EXTENSIONS,
+	ImageTooLargeError,
+	crop_image,
+	load_image,
+	scale_to_text_height,
+	split_tiles,
+)
+from backend.limits import RequestSizeLimitMiddleware, RequestTooLargeError
+from backend.metrics import (
+	ANALYSES,
+	ANALYSIS_ERRORS,
+	CACHE_LOOKUPS,
+	QUEUE_JOBS,
+	MetricsMiddleware,
+	observe_stages,
+	registry,
+	time_stage,
+)
 from backend.models import (
 	User,
 	UserSession,
@@ -28,8 +58,58 @@ from backend.models import (
 	engine,
 	get_db_session,
 )
-from backend.settings import LOGGING_CONFIG, TESSERACT_PATH, VITE_DEV_URL, WITH_AUTH
-from ocr import P2TOutput, Settings, analyse_p2t, analyse_tesseract, convert_output
+from backend.profiler import ProfileStore, RequestProfile, current_profile, profiling
+from backend.session_cache import CachedSession, SessionCache
+from backend.settings import (
+	EXPORT_MAX_WORKERS,
+	IMAGE_MAX_PIXELS,
+	IMAGE_MAX_SIDE,
+	IMAGE_TEXT_HEIGHT,
+	IMAGE_TILE_HEIGHT,
+	IMAGE_TILE_MARGIN,
+	LOGGING_CONFIG,
+	METRICS_TOKEN,
+	OCR_BATCH_CONCURRENCY,
+	OCR_BATCH_MAX_PAGES,
+	OCR_BATCH_WINDOW,
+	OCR_EXECUTOR,
+	OCR_MAX_BATCH_SIZE,
+	OCR_MAX_QUEUE,
+	OCR_MAX_WORKERS,
+	OCR_PDF_DPI,
+	OCR_RETRY_AFTER,
+	OCR_WARM_UP,
+	OCR_WORKER_THREADS,
+	PROFILE_DIR,
+	PROFILE_MAX_FILES,
+	RESULT_CACHE_BYTES,
+	RESULT_CACHE_DIR,
+	RESULT_CACHE_DISK_BYTES,
+	SESSION_CACHE_SIZE,
+	SESSION_CACHE_TTL,
+	TESSDATA_PATH,
+	TESSERACT_PATH,
+	UPLOAD_MAX_BYTES,
+	VITE_DEV_URL,
+	WITH_AUTH,
+)
+from ocr import (
+	P2TInput,
+	P2TOutput,
+	P2TResult,
+	Settings,
+	analyse_p2t,
+	analyse_p2t_batch,
+	analyse_pdf_page,
+	analyse_tesseract,
+	convert_output,
+	count_pages,
+	formatter,
+	init_worker,
+	warm_up,
+)
+from ocr.stages import run_profiled, run_timed, stage
+from utils.sorter import Sorter
 
 logger = logging.getLogger('uvicorn.error')
 
@@ -37,6 +117,11 @@ logger = logging.getLogger('uvicorn.error')
 APP_DIR = Path(__file__).resolve().parent
 BASE_DIR = APP_DIR.parent
 DEV_MODE = '--reload' in sys.argv or 'dev' in sys.argv
+ZIP_CONTENT_TYPES = ['application/zip', 'application/x-zip-compressed']
+
+
+# Pillow refuses to decode anything far past this size, as a backstop to the check in load_image
+Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS if IMAGE_MAX_PIXELS > 0 else None
 
 
 # To ensure JS file deliver correctly
@@ -47,6 +132,63 @@ mimetypes.add_type('application/javascript', '.js')
 # Database Dependencies
 SessionDep = Annotated[Session, Depends(get_db_session)]
 
+# Analysis Worker Pool
+# In process mode every worker holds its own model, the web process never loads one
+executor = AnalysisExecutor(
+	OCR_EXECUTOR,
+	OCR_MAX_WORKERS,
+	OCR_MAX_QUEUE,
+	initializer=init_worker if OCR_EXECUTOR == 'process' else None,
+	initargs=(OCR_WORKER_THREADS,),
+	on_timings=observe_stages,
+)
+
+
+# Concurrent requests of the same input type are recognised together as one job
+async def analyse_batch(input_type: P2TInput, images: list[Image.Image]):
+	return await executor.run(analyse_p2t_batch, images, input_type, [P2TOutput.LATEX])
+
+
+batcher = MicroBatcher(analyse_batch, OCR_BATCH_WINDOW, OCR_MAX_BATCH_SIZE)
+
+# DOCX Export Pool, formulas of large exports are converted across processes
+export_executor = (
+	AnalysisExecutor('process', EXPORT_MAX_WORKERS, on_timings=observe_stages) if EXPORT_MAX_WORKERS > 0 else None
+)
+
+# Analysis Result Cache, built on startup so spawned workers importing this module never touch the cache folder
+result_cache: ResultCache | None = None
+RESULT_SOURCES = ['backend/image_operation.py', 'ocr/p2t.py', 'ocr/sanitiser.py', 'ocr/tesseract.py']
+RESULT_PACKAGES = ['pix2text', 'pytesseract', 'tesserocr', 'latex2mathml']
+
+
+def package_version(package: str) -> str | None:
+	try:
+		return importlib.metadata.version(package)
+	except importlib.metadata.PackageNotFoundError:
+		return None
+
+
+def create_result_cache() -> ResultCache:
+	# Cached LaTeX is only reused while the code, packages and settings producing it stay the same
+	salt = ResultCache.make_salt(
+		*((BASE_DIR / source).read_bytes() for source in RESULT_SOURCES),
+		*(package_version(package) for package in RESULT_PACKAGES),
+		IMAGE_MAX_SIDE,
+		IMAGE_TEXT_HEIGHT,
+		IMAGE_TILE_HEIGHT,
+		IMAGE_TILE_MARGIN,
+		OCR_PDF_DPI,
+	)
+	return ResultCache(RESULT_CACHE_BYTES, RESULT_CACHE_DIR, RESULT_CACHE_DISK_BYTES, salt)
+
+
+# Validated Session Cache
+session_cache = SessionCache(SESSION_CACHE_TTL, SESSION_CACHE_SIZE)
+
+# Request Profiles, taken only when an admin asks for one
+profile_store = ProfileStore(PROFILE_DIR, PROFILE_MAX_FILES)
+
 
 # Contexts
 def dev_context(request: Request):
@@ -54,58 +196,94 @@ def dev_context(request: Request):
 
 
 def user_context(request: Request):
-	with Session(engine) as db_session:
-		if not WITH_AUTH:
-			return {
-				'admin': False,
-				'user': {'full_name': '', 'username': ''},
-				'csrf_token': '',
-			}
-
-		session_id = request.cookies.get('session_id')
-		if session_id is None:
-			return {}
-
-		session = select(UserSession).where(UserSession.session_id == session_id)
-		session = db_session.exec(session).first()
-		if session is None or not session.is_valid():
-			return {}
-
+	if not WITH_AUTH:
 		return {
-			'admin': session.user.admin,
-			'user': {'full_name': session.user.full_name, 'username': session.user.username},
-			'csrf_token': session.csrf_token,
+			'admin': False,
+			'user': {'full_name': '', 'username': ''},
+			'csrf_token': '',
 		}
 
+	with Session(engine) as db_session:
+		session = find_session(db_session, request.cookies.get('session_id'))
+
+	if session is None:
+		return {}
+
+	return {
+		'admin': session.user.admin,
+		'user': {'full_name': session.user.full_name, 'username': session.user.username},
+		'csrf_token': session.csrf_token,
+	}
+
+
+# Model Warm-up
+# Without warm-up the models load on the first request, so the server is ready straight away, only cold
+readiness = {'ready': not OCR_WARM_UP, 'warm': False, 'error': None}
+
+
+async def warm_up_models():
+	try:
+		# One job per worker so each of them loads its model before real requests arrive
+		await asyncio.gather(*[executor.run(warm_up) for _ in range(executor.max_workers)])
+		readiness['ready'] = True
+		readiness['warm'] = True
+		logger.info('Models warmed up!')
+	except Exception as error:
+		logger.error('Model warm-up failed!')
+		logger.exception(error)
+		readiness['error'] = str(error)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+	global result_cache
+
 	create_db_and_tables()
+	result_cache = await run_in_threadpool(create_result_cache)
+
+	warm_up_task = asyncio.create_task(warm_up_models()) if OCR_WARM_UP else None
 	yield
 
+	if warm_up_task is not None:
+		warm_up_task.cancel()
+	executor.shutdown()
+	if export_executor is not None:
+		export_executor.shutdown()
+
 
 # Verification Dependencies
-async def verify_csrf(db_session: SessionDep, csrf_token: Annotated[str, Form()] = None):
-	if not WITH_AUTH:
+def find_session(db_session: Session, session_id: str | None, csrf_token: str | None = None) -> CachedSession | None:
+	if session_id is None:
 		return None
 
-	query = select(UserSession).where(UserSession.csrf_token == csrf_token)
-	user_session = db_session.exec(query).first()
+	# Validated sessions are served from memory, the database is only asked on a miss
+	user_session = session_cache.get(session_id)
+	if user_session is None:
+		query = select(UserSession).where(UserSession.session_id == session_id)
+		user_session = db_session.exec(query).first()
 
-	if user_session is None or not user_session.is_valid():
-		raise HTTPException(status_code=401, detail='User not logged in!')
+		if user_session is None or not user_session.is_valid():
+			return None
+		user_session = session_cache.set(CachedSession.from_session(user_session))
+
+	if csrf_token is not None and not secrets.compare_digest(user_session.csrf_token, csrf_token):
+		return None
 
 	return user_session
 
 
-async def verify_session(db_session: SessionDep, session_id: Annotated[str | None, Cookie()] = None):
+async def verify_user(
+	db_session: SessionDep,
+	session_id: Annotated[str | None, Cookie()] = None,
+	csrf_token: Annotated[str, Form()] = None,
+):
 	if not WITH_AUTH:
 		return None
 
-	query = select(UserSession).where(UserSession.session_id == session_id)
-	user_session = db_session.exec(query).first()
+	# Session and CSRF token are checked together, and must belong to the same session
+	user_session = find_session(db_session, session_id, csrf_token or '')
 
-	if user_session is None or not user_session.is_valid():
+	if user_session is None:
 		raise HTTPException(status_code=401, detail='User not logged in!')
 
 	return user_session
@@ -119,22 +297,55 @@ async def verify_admin(
 	if not WITH_AUTH:
 		return None
 
-	query = select(UserSession).where(UserSession.session_id == session_id).where(UserSession.csrf_token == csrf_token)
-	user_session = db_session.exec(query).first()
+	user_session = find_session(db_session, session_id, csrf_token or '')
 
-	if user_session is None or not user_session.is_valid() or not user_session.user.admin:
+	if user_session is None or not user_session.user.admin:
 		raise HTTPException(status_code=404)
 
 	return user_session
 
 
+def is_enabled(value: str | None) -> bool:
+	return value is not None and value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+async def get_profile(
+	request: Request,
+	user_session: Annotated[CachedSession | None, Depends(verify_user)],
+	profile: Annotated[str | None, Form()] = None,
+	x_profile: Annotated[str | None, Header()] = None,
+):
+	# Opt in with a profile form field or an X-Profile header, only read for admins so other values never fail a request
+	if not profile_store.enabled or user_session is None or not user_session.user.admin:
+		return None
+
+	if not any(is_enabled(value) for value in (profile, x_profile)):
+		return None
+
+	return RequestProfile(request.url.path, user_session.user.username)
+
+
 async def get_session(db_session: SessionDep, session_id: Annotated[str | None, Cookie()] = None):
 	if not WITH_AUTH:
 		return None
 
-	query = select(UserSession).where(UserSession.session_id == session_id)
-	user_session = db_session.exec(query).first()
-	return user_session
+	return find_session(db_session, session_id)
+
+
+async def verify_monitor(
+	user_session: Annotated[UserSession, Depends(get_session)],
+	authorization: Annotated[str | None, Header()] = None,
+):
+	# Scrapers send the metrics token, admins can open these from their browser session
+	if METRICS_TOKEN and secrets.compare_digest((authorization or '').encode(), f'Bearer {METRICS_TOKEN}'.encode()):
+		return
+
+	# Without users or a token the whole app is open, the same as every other route
+	if not WITH_AUTH and not METRICS_TOKEN:
+		return
+
+	if not WITH_AUTH or (user_session is None or not user_session.is_valid() or not user_session.user.admin):
+		raise HTTPException(status_code=404)
 
 
 async def get_csrf(
@@ -152,6 +363,7 @@ async def get_csrf(
 
 # Application
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(RequestSizeLimitMiddleware, max_bytes=UPLOAD_MAX_BYTES)
 app.add_middleware(
 	CORSMiddleware,
 	allow_origins=['*'],
@@ -159,6 +371,8 @@ app.add_middleware(
 	allow_methods=['*'],
 	allow_headers=['*'],
 )
+# Added last so it is outermost, every request and error response is counted
+app.add_middleware(MetricsMiddleware)
 
 # Template and Static Files
 app.mount('/static', StaticFiles(directory=APP_DIR / 'static'), name='static')
@@ -170,7 +384,21 @@ class InputType(str, Enum):
 	MS_TEXT = 'ms_text'
 	EN_MS_TEXT = 'en_ms_text'
 	TEXT = 'text'
+	FORMULA = 'formula'
 	TEXT_FORMULA = 'text_formula'
+	PDF = 'pdf'
+
+
+PAGE_EXTENSIONS = {*IMAGE_EXTENSIONS, '.pdf'}
+
+TESSERACT_INPUTS = [InputType.EN_TEXT, InputType.MS_TEXT, InputType.EN_MS_TEXT]
+SCALED_INPUTS = [InputType.TEXT, InputType.TEXT_FORMULA]
+
+
+class OutputFormat(str, Enum):
+	LATEX = 'latex'
+	MATHML = 'mathml'
+	OMML = 'omml'
 
 
 # Application
@@ -182,71 +410,390 @@ async def root(request: Request, user_session: Annotated[UserSession, Depends(ge
 		return RedirectResponse('/login', 302)
 
 
-@app.post('/analyse', dependencies=[Depends(verify_session), Depends(verify_csrf)])
-async def analyse(
-	file: Annotated[UploadFile, Form()],
-	analysis_type: Annotated[InputType, Form()],
-	response: Response,
-):
+class AnalysisError(Exception):
+	def __init__(self, status_code: int, error: str, headers: dict[str, str] | None = None):
+		super().__init__(error)
+		self.status_code = status_code
+		self.error = error
+		self.headers = headers or {}
+
+
+def get_tesseract_settings(analysis_type: InputType) -> Settings:
+	settings = {
+		'TESSERACT_PATH': TESSERACT_PATH,
+		'TESSDATA_PATH': TESSDATA_PATH,
+		'TIMEOUT': 0,
+		'OUTPUT_TYPE': 'TEXT',
+		'COMBINE': True,
+		'CLEAR_OUTPUT': True,
+		'PRINT_TEXT': False,
+	}
+	if analysis_type == InputType.EN_TEXT:
+		settings['LANG'] = 'eng'
+	elif analysis_type == InputType.MS_TEXT:
+		settings['LANG'] = 'msa'
+	elif analysis_type == InputType.EN_MS_TEXT:
+		settings['LANG'] = 'eng+msa'
+	return Settings(settings)
+
+
+def get_default_formats(analysis_type: InputType) -> list[OutputFormat]:
+	# Text only analysis has no formula to convert, unless asked otherwise
+	if analysis_type in TESSERACT_INPUTS:
+		return [OutputFormat.LATEX]
+	return [OutputFormat.LATEX, OutputFormat.MATHML]
+
+
+async def run_analysis(job: Awaitable):
 	try:
-		image = Image.open(BytesIO(await file.read()))
-		image = convert_to_jpeg(image)
+		return await job
+	except QueueFullError:
+		raise AnalysisError(503, 'Server busy! Please try again later!', {'Retry-After': str(OCR_RETRY_AFTER)})
+	except Exception as error:
+		logger.error('Analysis failed!')
+		logger.exception(error)
+		raise AnalysisError(422, 'Failed to analyse! Image too complex!')
+
+
+async def run_staged(fn: Callable, *args):
+	# Same as run_in_threadpool, with the stages timed inside fn recorded to the metrics
+	profile = current_profile.get()
+	if profile is None:
+		result, timings = await run_in_threadpool(run_timed, fn, *args)
+	else:
+		result, timings, stats = await run_in_threadpool(run_profiled, fn, *args)
+		profile.add(fn.__name__, timings, stats)
+
+	observe_stages(timings)
+	return result
+
+
+async def select_formats(latex: list[str], formats: list[OutputFormat]) -> dict:
+	# Only the requested formats are converted, off the event loop
+	results = P2TResult(latex)
+	return await run_staged(results.select, [P2TOutput(output_format.value) for output_format in formats])
+
+
+def preprocess_image(file: IO[bytes], analysis_type: InputType) -> Image.Image | None:
+	with stage('decode'):
+		image = load_image(file, IMAGE_MAX_SIDE, IMAGE_MAX_PIXELS)
+	with stage('crop'):
 		image = crop_image(image)
 
+	# Large handwriting and photos of pages are shrunk to a text height the models handle well
+	if image is not None and IMAGE_TEXT_HEIGHT > 0 and analysis_type in SCALED_INPUTS:
+		with stage('scale'):
+			image = scale_to_text_height(image, IMAGE_TEXT_HEIGHT)
+
+	return image
+
+
+def find_result(image: Image.Image, analysis_type: str) -> tuple[str, list[str] | None]:
+	with stage('cache_lookup'):
+		cache_key = result_cache.make_key(image, analysis_type)
+		return cache_key, result_cache.get(cache_key)
+
+
+def tile_image(image: Image.Image) -> list[Image.Image]:
+	with stage('tile'):
+		return split_tiles(image, IMAGE_TILE_HEIGHT, IMAGE_TILE_MARGIN)
+
+
+async def recognise_image(image: Image.Image, analysis_type: InputType, batched: bool = True) -> list[str]:
+	if analysis_type in TESSERACT_INPUTS:
+		return await executor.run(analyse_tesseract, get_tesseract_settings(analysis_type), image)
+
+	# Only formula recognition has a batch API, other types are spread over the workers one image per job
+	# Profiled requests skip the batcher so the profile only holds their own images
+	if batched and analysis_type == InputType.FORMULA and current_profile.get() is None:
+		results = await batcher.submit(P2TInput(analysis_type.value), image)
+	else:
+		results = await executor.run(analyse_p2t, image, P2TInput(analysis_type.value), [P2TOutput.LATEX])
+
+	return results[P2TOutput.LATEX.value]
+
+
+async def recognise_tiles(image: Image.Image, analysis_type: InputType) -> list[str]:
+	# A single formula cannot be cut, tall pages are split between lines
+	if analysis_type == InputType.FORMULA or IMAGE_TILE_HEIGHT <= 0:
+		tiles = [image]
+	else:
+		tiles = await run_staged(tile_image, image)
+
+	if len(tiles) == 1:
+		return await recognise_image(image, analysis_type)
+
+	# Tiles skip the batcher so they spread over the workers, and are joined back top to bottom
+	outputs = await asyncio.gather(*(recognise_image(tile, analysis_type, batched=False) for tile in tiles))
+	return [line for output in outputs for line in output]
+
+
+# Shared by single and batch analysis, each image goes through the same executor, batcher and cache
+async def analyse_image(file: IO[bytes], analysis_type: InputType, formats: list[OutputFormat] | None = None) -> dict:
+	ANALYSES.inc(input_type=analysis_type.value)
+
+	try:
+		image = await run_staged(preprocess_image, file, analysis_type)
+
 		if image is None:
-			return {'output': {'latex': ['Empty image']}}
+			return {'latex': ['Empty image']}
+	except (ImageTooLargeError, Image.DecompressionBombError) as error:
+		logger.error(error)
+		raise AnalysisError(413, f'Image too large! Maximum {IMAGE_MAX_PIXELS} pixels!')
 	except Exception as error:
 		logger.error('Invalid Image!')
 		logger.exception(error)
-		response.status_code = 415
-		return {'error': 'Invalid Image!'}
-
-	if analysis_type in [InputType.EN_TEXT, InputType.MS_TEXT, InputType.EN_MS_TEXT]:
-		settings = {
-			'TESSERACT_PATH': TESSERACT_PATH,
-			'TIMEOUT': 0,
-			'OUTPUT_TYPE': 'TEXT',
-			'COMBINE': True,
-			'CLEAR_OUTPUT': True,
-			'PRINT_TEXT': False,
-		}
-		if analysis_type == InputType.EN_TEXT:
-			settings['LANG'] = 'eng'
-		elif analysis_type == InputType.MS_TEXT:
-			settings['LANG'] = 'msa'
-		elif analysis_type == InputType.EN_MS_TEXT:
-			settings['LANG'] = 'eng+msa'
-		settings = Settings(settings)
+		raise AnalysisError(415, 'Invalid Image!')
+
+	# Hashing every pixel and reading the disk tier stay off the event loop
+	cache_key, latex = await run_staged(find_result, image, analysis_type.value)
+	CACHE_LOOKUPS.inc(result='miss' if latex is None else 'hit')
+
+	if latex is None:
+		latex = await run_analysis(recognise_tiles(image, analysis_type))
+		await run_in_threadpool(result_cache.set, cache_key, latex)
+
+	return await select_formats(latex, formats or get_default_formats(analysis_type))
+
+
+async def analyse_pdf_page_output(document: Path, page_number: int, formats: list[OutputFormat] | None = None) -> dict:
+	ANALYSES.inc(input_type=InputType.PDF.value)
+	results = await run_analysis(
+		executor.run(
+			analyse_pdf_page,
+			document,
+			page_number,
+			[P2TOutput.LATEX],
+			OCR_PDF_DPI,
+			IMAGE_MAX_SIDE,
+			IMAGE_MAX_PIXELS,
+		)
+	)
+	return await select_formats(results[P2TOutput.LATEX.value], formats or get_default_formats(InputType.PDF))
 
-		result_tesseract = analyse_tesseract(settings, image)
-		return {'output': {'latex': result_tesseract}}
 
-	try:
-		results = analyse_p2t(image, analysis_type, [P2TOutput.LATEX, P2TOutput.OMML, P2TOutput.MATHML])
+def spool_pdf(source: IO[bytes] | bytes) -> Path:
+	# Page jobs only carry the path, the workers open the document from disk instead of receiving all of it every page
+	with NamedTemporaryFile(prefix='math-ocr-', suffix='.pdf', delete=False) as spool:
+		try:
+			if isinstance(source, bytes):
+				spool.write(source)
+			else:
+				source.seek(0)
+				shutil.copyfileobj(source, spool)
+		except BaseException:
+			Path(spool.name).unlink(missing_ok=True)
+			raise
 
-		return {
-			'output': {
-				'latex': results[P2TOutput.LATEX.value],
-				'mathml': results[P2TOutput.MATHML.value],
-			}
-		}
+	return Path(spool.name)
+
+
+async def count_pdf_pages(document: Path) -> int:
+	try:
+		page_count = await run_in_threadpool(count_pages, document)
 	except Exception as error:
-		logger.error('Analysis failed!')
+		logger.error('Invalid PDF!')
 		logger.exception(error)
-		response.status_code = 422
-		return {'error': 'Failed to analyse! Image too complex!'}
+		raise AnalysisError(415, 'Invalid PDF!')
+
+	if page_count == 0:
+		raise AnalysisError(415, 'Invalid PDF!')
+	return page_count
+
+
+async def analyse_pdf(document: Path, formats: list[OutputFormat] | None = None) -> dict:
+	page_count = await count_pdf_pages(document)
+	if page_count > OCR_BATCH_MAX_PAGES:
+		raise AnalysisError(413, f'Too many pages! Maximum {OCR_BATCH_MAX_PAGES} pages per batch!')
+
+	# Pages are recognised across the workers, a few at a time, and joined back in page order
+	semaphore = asyncio.Semaphore(OCR_BATCH_CONCURRENCY)
 
+	async def analyse_page(page_number: int) -> dict:
+		async with semaphore:
+			return await analyse_pdf_page_output(document, page_number, formats)
 
-@app.post('/download', dependencies=[Depends(verify_session), Depends(verify_csrf)])
+	outputs = await asyncio.gather(*(analyse_page(page_number) for page_number in range(page_count)))
+	return {key: [line for output in outputs for line in output[key]] for key in outputs[0]}
+
+
+@app.post('/analyse', dependencies=[Depends(verify_user)])
+async def analyse(
+	file: Annotated[UploadFile, Form()],
+	analysis_type: Annotated[InputType, Form()],
+	response: Response,
+	profile: Annotated[RequestProfile | None, Depends(get_profile)],
+	formats: Annotated[list[OutputFormat] | None, Form()] = None,
+):
+	try:
+		async with profiling(profile_store, profile):
+			if analysis_type == InputType.PDF:
+				with time_stage('upload_read'):
+					document = await run_in_threadpool(spool_pdf, file.file)
+				try:
+					return {'output': await analyse_pdf(document, formats)}
+				finally:
+					document.unlink(missing_ok=True)
+
+			# Large uploads are already spooled to disk, decode straight from there instead of reading them into memory
+			return {'output': await analyse_image(file.file, analysis_type, formats)}
+	except AnalysisError as error:
+		ANALYSIS_ERRORS.inc(input_type=analysis_type.value, status=error.status_code)
+		response.status_code = error.status_code
+		response.headers.update(error.headers)
+		return {'error': error.error}
+
+
+def is_zip(file: UploadFile) -> bool:
+	return file.content_type in ZIP_CONTENT_TYPES or Path(file.filename or '').suffix.lower() == '.zip'
+
+
+def is_page(info: zipfile.ZipInfo) -> bool:
+	# Folders, macOS resource forks and files like .DS_Store or Thumbs.db are not pages
+	path = PurePosixPath(info.filename)
+	return (
+		not info.is_dir()
+		and '__MACOSX' not in path.parts
+		and not path.name.startswith('._')
+		and path.suffix.lower() in PAGE_EXTENSIONS
+	)
+
+
+def read_zip(file: IO[bytes]) -> list[tuple[str, bytes]]:
+	try:
+		with zipfile.ZipFile(file) as archive:
+			members = [info for info in archive.infolist() if is_page(info)]
+
+			# Checked against the declared sizes so a zip bomb is never extracted
+			if UPLOAD_MAX_BYTES > 0 and sum(info.file_size for info in members) > UPLOAD_MAX_BYTES:
+				raise RequestTooLargeError()
+
+			return [(info.filename, archive.read(info)) for info in members]
+	except (RuntimeError, NotImplementedError, zlib.error, EOFError) as error:
+		# Encrypted members, unsupported compression and corrupt data are all an unreadable zip
+		raise zipfile.BadZipFile(str(error)) from error
+
+
+async def read_pages(files: list[UploadFile]) -> list[tuple[str, bytes]]:
+	pages = []
+
+	for file in files:
+		if is_zip(file):
+			# Extracted in the threadpool, decompressing up to UPLOAD_MAX_BYTES would stall every other request
+			with time_stage('upload_read'):
+				pages.extend(await run_in_threadpool(read_zip, file.file))
+		else:
+			with time_stage('upload_read'):
+				data = await file.read()
+			pages.append((file.filename or f'page-{len(pages) + 1}', data))
+
+	return pages
+
+
+def order_pages(pages: list[tuple[str, bytes]]) -> list[tuple[str, bytes]]:
+	return sorted(pages, key=lambda page: Sorter.path_key(Path(page[0])))
+
+
+@app.post('/analyse/batch', dependencies=[Depends(verify_user)])
+async def analyse_pages(
+	files: Annotated[list[UploadFile], Form()],
+	analysis_type: Annotated[InputType, Form()],
+	response: Response,
+	formats: Annotated[list[OutputFormat] | None, Form()] = None,
+):
+	try:
+		pages = [(name, data, None) for name, data in order_pages(await read_pages(files))]
+	except zipfile.BadZipFile:
+		response.status_code = 415
+		return {'error': 'Invalid Zip File!'}
+	except RequestTooLargeError:
+		response.status_code = 413
+		return {'error': f'Zip File too large! Maximum {UPLOAD_MAX_BYTES} bytes uncompressed!'}
+
+	# Spooled PDFs are removed when the batch is rejected here, otherwise once every page has been streamed
+	with ExitStack() as stack:
+		# Every PDF expands into its pages, which are only rasterised once their turn comes
+		if analysis_type == InputType.PDF:
+			try:
+				documents = []
+				for name, data, _ in pages:
+					document = await run_in_threadpool(spool_pdf, data)
+					stack.callback(document.unlink, missing_ok=True)
+					documents.append((name, document))
+
+				pages = [
+					(f'{name}#{page_number + 1}', document, page_number)
+					for name, document in documents
+					for page_number in range(await count_pdf_pages(document))
+				]
+			except AnalysisError as error:
+				response.status_code = error.status_code
+				return {'error': error.error}
+
+		if not pages:
+			response.status_code = 400
+			return {'error': 'No pages uploaded!'}
+		if len(pages) > OCR_BATCH_MAX_PAGES:
+			response.status_code = 413
+			return {'error': f'Too many pages! Maximum {OCR_BATCH_MAX_PAGES} pages per batch!'}
+
+		spooled = stack.pop_all()
+
+	# Bounded so one batch cannot take the whole analysis queue from other users
+	semaphore = asyncio.Semaphore(OCR_BATCH_CONCURRENCY)
+
+	async def analyse_page(page: int, name: str, data: bytes | Path, page_number: int | None) -> dict:
+		async with semaphore:
+			try:
+				if page_number is None:
+					output = await analyse_image(BytesIO(data), analysis_type, formats)
+				else:
+					output = await analyse_pdf_page_output(data, page_number, formats)
+				return {'page': page, 'name': name, 'output': output}
+			except AnalysisError as error:
+				input_type = analysis_type if page_number is None else InputType.PDF
+				ANALYSIS_ERRORS.inc(input_type=input_type.value, status=error.status_code)
+				return {'page': page, 'name': name, 'status': error.status_code, 'error': error.error}
+
+	async def stream_pages() -> AsyncIterator[str]:
+		yield json.dumps({'pages': [name for name, _, _ in pages]}) + '\n'
+
+		tasks = [asyncio.create_task(analyse_page(page, *entry)) for page, entry in enumerate(pages, 1)]
+		try:
+			# Each page is sent as soon as it is done, clients reorder by page number
+			for task in asyncio.as_completed(tasks):
+				yield json.dumps(await task) + '\n'
+		finally:
+			for task in tasks:
+				task.cancel()
+			spooled.close()
+
+	return StreamingResponse(stream_pages(), media_type='application/x-ndjson')
+
+
+def iter_file(stream: IO[bytes], chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+	with stream:
+		while chunk := stream.read(chunk_size):
+			yield chunk
+
+
+@app.post('/download', dependencies=[Depends(verify_user)])
 async def download(
 	latex: Annotated[list[str], Form()],
 	response: Response,
+	profile: Annotated[RequestProfile | None, Depends(get_profile)],
 ):
 	try:
-		stream = convert_output(latex, output_type=P2TOutput.DOCX)
+		async with profiling(profile_store, profile):
+			stream = await run_staged(
+				convert_output,
+				latex,
+				P2TOutput.DOCX,
+				export_executor.executor if export_executor is not None else None,
+			)
 		stream.seek(0)
 		return StreamingResponse(
-			stream,
+			iter_file(stream),
 			media_type='application/octet',
 			headers={'Content-Disposition': 'attachment; filename="math-ocr.docx"'},
 		)
@@ -271,7 +818,11 @@ async def admin_page(
 	users = db_session.exec(users).all()
 	users = [user.model_dump() for user in users]
 
-	return templates.TemplateResponse(request=request, name='admin.html', context={'users': users})
+	return templates.TemplateResponse(
+		request=request,
+		name='admin.html',
+		context={'users': users, 'profiles': await run_in_threadpool(profile_store.entries)},
+	)
 
 
 @app.post('/admin', dependencies=[Depends(verify_admin)])
@@ -290,12 +841,32 @@ async def admin(
 	update_user.is_activated = status
 	db_session.add(update_user)
 	db_session.commit()
+	session_cache.invalidate_user(update_user.id)
 
 	users = select(User).where(User.username != user_session.user.username)
 	users = db_session.exec(users).all()
 	users = [user.model_dump() for user in users]
 
-	return templates.TemplateResponse(request=request, name='admin.html', context={'users': users})
+	return templates.TemplateResponse(
+		request=request,
+		name='admin.html',
+		context={'users': users, 'profiles': await run_in_threadpool(profile_store.entries)},
+	)
+
+
+@app.get('/admin/profiles/{filename}')
+async def admin_profile(
+	filename: str,
+	user_session: Annotated[UserSession, Depends(get_session)],
+):
+	if not WITH_AUTH or (user_session is None or not user_session.is_valid() or not user_session.user.admin):
+		raise HTTPException(status_code=404)
+
+	path = profile_store.find(filename)
+	if path is None:
+		raise HTTPException(status_code=404)
+
+	return FileResponse(path, filename=filename)
 
 
 # Authentications
@@ -411,6 +982,32 @@ async def register(
 	)
 
 
+@app.get('/ready')
+async def ready(response: Response):
+	if not readiness['ready']:
+		response.status_code = 503
+
+	return readiness
+
+
+@app.get('/status', dependencies=[Depends(verify_monitor)])
+async def status():
+	return {
+		'queue': executor.status(),
+		'cache': result_cache.status() if result_cache is not None else None,
+		'sessions': session_cache.status(),
+		'formatter': formatter.cache_info(),
+	}
+
+
+@app.get('/metrics', dependencies=[Depends(verify_monitor)])
+async def metrics():
+	# Queue depth is read when scraped rather than tracked on every job
+	QUEUE_JOBS.set(executor.running, state='running')
+	QUEUE_JOBS.set(executor.queued, state='queued')
+	return PlainTextResponse(registry.render(), media_type='text/plain; version=0.0.4')
+
+
 @app.get('/csrf')
 async def csrf(user_session: Annotated[UserSession, Depends(get_session)], response: Response):
 	if not WITH_AUTH:
@@ -431,6 +1028,7 @@ async def logout(user_session: Annotated[UserSession, Depends(get_csrf)], db_ses
 		user_session.is_revoked = True
 		db_session.add(user_session)
 		db_session.commit()
+		session_cache.invalidate(user_session.session_id)
 
 		response = RedirectResponse('/login', 302)
 		response.delete_cookie('session_id')
@@ -0,0 +1,199 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = '') -> str:
+	labels = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+	if extra:
+		labels.append(extra)
+	return '{' + ','.join(labels) + '}' if labels else ''
+
+
+def escape(value: str) -> str:
+	return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value: float) -> str:
+	if value == math.inf:
+		return '+Inf'
+	return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+	type = ''
+
+	def __init__(self, name: str, description: str, labels: Iterable[str] = ()):
+		self.name = name
+		self.description = description
+		self.labels = tuple(labels)
+		self.lock = threading.Lock()
+
+	def key(self, labels: dict[str, str]) -> tuple[str, ...]:
+		return tuple(str(labels.get(label, '')) for label in self.labels)
+
+	def header(self) -> list[str]:
+		return [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.type}']
+
+	def render(self) -> list[str]:
+		raise NotImplementedError()
+
+
+class Counter(Metric):
+	type = 'counter'
+
+	def __init__(self, name: str, description: str, labels: Iterable[str] = ()):
+		super().__init__(name, description, labels)
+		self.values: dict[tuple[str, ...], float] = {}
+
+	def inc(self, amount: float = 1, **labels):
+		key = self.key(labels)
+		with self.lock:
+			self.values[key] = self.values.get(key, 0) + amount
+
+	def render(self) -> list[str]:
+		with self.lock:
+			values = dict(self.values)
+		return [
+			*self.header(),
+			*(f'{self.name}{format_labels(self.labels, key)} {format_value(value)}' for key, value in values.items()),
+		]
+
+
+class Gauge(Counter):
+	type = 'gauge'
+
+	def dec(self, amount: float = 1, **labels):
+		self.inc(-amount, **labels)
+
+	def set(self, value: float, **labels):
+		with self.lock:
+			self.values[self.key(labels)] = value
+
+
+class Histogram(Metric):
+	type = 'histogram'
+
+	def __init__(
+		self,
+		name: str,
+		description: str,
+		labels: Iterable[str] = (),
+		buckets: Iterable[float] = DEFAULT_BUCKETS,
+	):
+		super().__init__(name, description, labels)
+		self.buckets = (*sorted(buckets), math.inf)
+		self.values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+	def observe(self, value: float, **labels):
+		key = self.key(labels)
+		with self.lock:
+			counts, total = self.values.setdefault(key, ([0] * len(self.buckets), [0.0]))
+			total[0] += value
+
+			# Counted once in its own bucket, rendering adds them up into the cumulative buckets
+			for index, bound in enumerate(self.buckets):
+				if value <= bound:
+					counts[index] += 1
+					break
+
+	def render(self) -> list[str]:
+		with self.lock:
+			values = {key: (list(counts), total[0]) for key, (counts, total) in self.values.items()}
+
+		lines = self.header()
+		for key, (counts, total) in values.items():
+			cumulative = 0
+			for bound, count in zip(self.buckets, counts):
+				cumulative += count
+				labels = format_labels(self.labels, key, f'le="{format_value(bound)}"')
+				lines.append(f'{self.name}_bucket{labels} {cumulative}')
+
+			lines.append(f'{self.name}_sum{format_labels(self.labels, key)} {format_value(total)}')
+			lines.append(f'{self.name}_count{format_labels(self.labels, key)} {cumulative}')
+
+		return lines
+
+
+class Registry:
+	def __init__(self):
+		self.metrics: list[Metric] = []
+
+	def register(self, metric: Metric) -> Metric:
+		self.metrics.append(metric)
+		return metric
+
+	def render(self) -> str:
+		return '\n'.join(line for metric in self.metrics for line in metric.render()) + '\n'
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.register(
+	Histogram('mathocr_request_seconds', 'Time spent handling a request.', ['method', 'route'])
+)
+REQUESTS_IN_FLIGHT = registry.register(
+	Gauge('mathocr_requests_in_flight', 'Requests currently being handled.', ['method'])
+)
+ERRORS = registry.register(Counter('mathocr_errors_total', 'Error responses by status code.', ['route', 'status']))
+STAGE_SECONDS = registry.register(
+	Histogram('mathocr_stage_seconds', 'Time spent in each step of the analysis pipeline.', ['stage'])
+)
+ANALYSES = registry.register(Counter('mathocr_analyses_total', 'Images or pages analysed by input type.', ['input_type']))
+ANALYSIS_ERRORS = registry.register(
+	Counter('mathocr_analysis_errors_total', 'Failed images or pages by status code.', ['input_type', 'status'])
+)
+CACHE_LOOKUPS = registry.register(Counter('mathocr_cache_lookups_total', 'Result cache lookups.', ['result']))
+QUEUE_JOBS = registry.register(Gauge('mathocr_queue_jobs', 'Analysis jobs in the worker pool.', ['state']))
+
+
+def observe_stages(timings: list[tuple[str, float]]):
+	for stage, seconds in timings:
+		STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+@contextmanager
+def time_stage(stage: str) -> Iterator[None]:
+	# For stages awaited on the event loop, worker stages are collected with ocr.stages instead
+	start = time.perf_counter()
+	try:
+		yield
+	finally:
+		STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+class MetricsMiddleware:
+	def __init__(self, app: ASGIApp):
+		self.app = app
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send):
+		if scope['type'] != 'http':
+			await self.app(scope, receive, send)
+			return
+
+		status = 500
+		start = time.perf_counter()
+
+		async def send_status(message: Message):
+			nonlocal status
+			if message['type'] == 'http.response.start':
+				status = message['status']
+			await send(message)
+
+		# Route is only known once the router has matched, so requests in flight are counted by method
+		REQUESTS_IN_FLIGHT.inc(method=scope['method'])
+		try:
+			await self.app(scope, receive, send_status)
+		finally:
+			REQUESTS_IN_FLIGHT.dec(method=scope['method'])
+
+			route = getattr(scope.get('route'), 'path', 'unmatched')
+			REQUEST_SECONDS.observe(time.perf_counter() - start, method=scope['method'], route=route)
+			if status >= 400:
+				ERRORS.inc(route=route, status=status)
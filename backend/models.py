@@ -4,8 +4,19 @@ from datetime import datetime, timedelta
 
 import bcrypt
 import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
 from sqlmodel import Field, Relationship, Session, SQLModel, create_engine
 
+from backend.settings import (
+	DATABASE_MAX_OVERFLOW,
+	DATABASE_POOL_RECYCLE,
+	DATABASE_POOL_SIZE,
+	DATABASE_POOL_TIMEOUT,
+	DATABASE_URL,
+	SQLITE_BUSY_TIMEOUT,
+)
+
 
 def generate_token():
 	return secrets.token_urlsafe(48)
@@ -55,9 +66,32 @@ class UserSession(SQLModel, table=True):
 		return not self.is_revoked and datetime.now() < self.expiration and self.user.is_activated
 
 
-db_url = 'sqlite:///db.sqlite'
-connect_args = {'check_same_thread': False}
-engine = create_engine(db_url, connect_args=connect_args)
+def set_sqlite_pragmas(connection, _):
+	# WAL lets readers carry on during a write, busy_timeout waits for the lock instead of failing right away
+	cursor = connection.cursor()
+	cursor.execute('PRAGMA journal_mode=WAL')
+	cursor.execute('PRAGMA synchronous=NORMAL')
+	cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}')
+	cursor.close()
+
+
+def create_db_engine(db_url: str) -> Engine:
+	if make_url(db_url).get_backend_name() == 'sqlite':
+		engine = create_engine(db_url, connect_args={'check_same_thread': False})
+		event.listen(engine, 'connect', set_sqlite_pragmas)
+		return engine
+
+	return create_engine(
+		db_url,
+		pool_size=DATABASE_POOL_SIZE,
+		max_overflow=DATABASE_MAX_OVERFLOW,
+		pool_timeout=DATABASE_POOL_TIMEOUT,
+		pool_recycle=DATABASE_POOL_RECYCLE,
+		pool_pre_ping=True,
+	)
+
+
+engine = create_db_engine(DATABASE_URL)
 
 
 def create_db_and_tables():
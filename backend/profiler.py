@@ -0,0 +1,126 @@
+import json
+import marshal
+import pstats
+import secrets
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator
+
+from starlette.concurrency import run_in_threadpool
+
+# Profile of the request being handled, read by the executor to decide whether a job runs under cProfile
+current_profile: ContextVar['RequestProfile | None'] = ContextVar('current_profile', default=None)
+
+
+class MarshalledStats:
+	# Loaded by pstats the same way as a Profile, for stats that were taken in a worker
+	def __init__(self, data: bytes):
+		self.stats = marshal.loads(data)
+
+	def create_stats(self):
+		pass
+
+
+class RequestProfile:
+	def __init__(self, route: str, username: str):
+		self.route = route
+		self.username = username
+		self.started = datetime.now()
+		self.elapsed = 0.0
+		self.jobs: list[str] = []
+		self.timings: list[tuple[str, float]] = []
+		self.stats: list[bytes] = []
+
+	def add(self, job: str, timings: list[tuple[str, float]], stats: bytes | None):
+		self.jobs.append(job)
+		self.timings.extend(timings)
+		if stats is not None:
+			self.stats.append(stats)
+
+	def summary(self) -> dict:
+		stages: dict[str, float] = {}
+		for stage, seconds in self.timings:
+			stages[stage] = stages.get(stage, 0) + seconds
+
+		return {
+			'route': self.route,
+			'user': self.username,
+			'started': self.started.isoformat(timespec='seconds'),
+			'elapsed': self.elapsed,
+			'jobs': self.jobs,
+			'stages': stages,
+			'timings': self.timings,
+		}
+
+
+class ProfileStore:
+	def __init__(self, directory: Path | None, max_files: int = 50):
+		self.directory = directory
+		self.max_files = max_files
+
+	@property
+	def enabled(self) -> bool:
+		return self.directory is not None
+
+	def save(self, profile: RequestProfile) -> str:
+		self.directory.mkdir(parents=True, exist_ok=True)
+		route = profile.route.strip('/').replace('/', '-') or 'root'
+		name = f'{profile.started:%Y%m%d-%H%M%S-%f}-{route}-{secrets.token_hex(4)}'
+
+		# Every job of the request is merged into one file, readable with pstats or snakeviz
+		if profile.stats:
+			stats = pstats.Stats(*(MarshalledStats(data) for data in profile.stats))
+			stats.dump_stats(self.directory / f'{name}.prof')
+
+		(self.directory / f'{name}.json').write_text(json.dumps(profile.summary(), indent=2), encoding='utf-8')
+		self.prune()
+		return name
+
+	def prune(self):
+		for path in sorted(self.directory.glob('*.json'), reverse=True)[self.max_files :]:
+			path.unlink(missing_ok=True)
+			path.with_suffix('.prof').unlink(missing_ok=True)
+
+	def entries(self) -> list[dict]:
+		if self.directory is None or not self.directory.exists():
+			return []
+
+		profiles = []
+		for path in sorted(self.directory.glob('*.json'), reverse=True):
+			try:
+				summary = json.loads(path.read_text(encoding='utf-8'))
+			except (OSError, ValueError):
+				continue
+
+			summary['name'] = path.stem
+			summary['has_stats'] = path.with_suffix('.prof').exists()
+			profiles.append(summary)
+
+		return profiles
+
+	def find(self, filename: str) -> Path | None:
+		# Only files the store wrote itself can be downloaded, never a path given by the client
+		if self.directory is None or Path(filename).name != filename or Path(filename).suffix not in ('.json', '.prof'):
+			return None
+
+		path = self.directory / filename
+		return path if path.is_file() else None
+
+
+@asynccontextmanager
+async def profiling(store: ProfileStore, profile: RequestProfile | None) -> AsyncIterator[None]:
+	if profile is None:
+		yield
+		return
+
+	token = current_profile.set(profile)
+	start = time.perf_counter()
+	try:
+		yield
+	finally:
+		current_profile.reset(token)
+		profile.elapsed = time.perf_counter() - start
+		await run_in_threadpool(store.save, profile)
@@ -0,0 +1,112 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+
+from backend.models import UserSession
+
+
+@dataclass(frozen=True)
+class CachedUser:
+	id: uuid.UUID
+	username: str
+	full_name: str
+	admin: bool
+	is_activated: bool
+
+
+@dataclass(frozen=True)
+class CachedSession:
+	session_id: str
+	csrf_token: str
+	user: CachedUser
+	expiration: datetime
+	is_revoked: bool
+
+	@staticmethod
+	def from_session(user_session: UserSession) -> 'CachedSession':
+		# Detached copy, so nothing lazy loads from a closed database session later
+		user = user_session.user
+		return CachedSession(
+			session_id=user_session.session_id,
+			csrf_token=user_session.csrf_token,
+			user=CachedUser(user.id, user.username, user.full_name, user.admin, user.is_activated),
+			expiration=user_session.expiration,
+			is_revoked=user_session.is_revoked,
+		)
+
+	def is_valid(self):
+		return not self.is_revoked and datetime.now() < self.expiration and self.user.is_activated
+
+
+class SessionCache:
+	def __init__(self, ttl: float = 60, max_entries: int = 10000):
+		self.ttl = ttl
+		self.max_entries = max_entries
+		self.entries: OrderedDict[str, tuple[CachedSession, float]] = OrderedDict()
+		self.user_sessions: dict[uuid.UUID, set[str]] = {}
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, session_id: str | None) -> CachedSession | None:
+		if self.ttl <= 0 or session_id is None:
+			return None
+
+		with self.lock:
+			entry = self.entries.get(session_id)
+
+			# Other processes and the CLI scripts cannot invalidate this cache, the TTL bounds how stale it gets
+			if entry is None or entry[1] < time.monotonic() or not entry[0].is_valid():
+				if entry is not None:
+					self.remove(session_id)
+				self.misses += 1
+				return None
+
+			self.entries.move_to_end(session_id)
+			self.hits += 1
+			return entry[0]
+
+	def set(self, user_session: CachedSession) -> CachedSession:
+		if self.ttl <= 0:
+			return user_session
+
+		with self.lock:
+			self.remove(user_session.session_id)
+			self.entries[user_session.session_id] = (user_session, time.monotonic() + self.ttl)
+			self.user_sessions.setdefault(user_session.user.id, set()).add(user_session.session_id)
+
+			while len(self.entries) > self.max_entries:
+				self.remove(next(iter(self.entries)))
+
+		return user_session
+
+	def remove(self, session_id: str):
+		entry = self.entries.pop(session_id, None)
+		if entry is None:
+			return
+
+		sessions = self.user_sessions.get(entry[0].user.id)
+		if sessions is not None:
+			sessions.discard(session_id)
+			if not sessions:
+				del self.user_sessions[entry[0].user.id]
+
+	def invalidate(self, session_id: str):
+		with self.lock:
+			self.remove(session_id)
+
+	def invalidate_user(self, user_id: uuid.UUID):
+		with self.lock:
+			for session_id in list(self.user_sessions.get(user_id, ())):
+				self.remove(session_id)
+
+	def status(self) -> dict[str, int | float]:
+		return {
+			'entries': len(self.entries),
+			'ttl': self.ttl,
+			'hits': self.hits,
+			'misses': self.misses,
+		}
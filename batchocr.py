@@ -0,0 +1,170 @@
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator
+
+from backend.image_operation import IMAGE_EXTENSIONS, crop_image, load_image, scale_to_text_height
+from backend.settings import IMAGE_MAX_PIXELS, IMAGE_MAX_SIDE, IMAGE_TEXT_HEIGHT, TESSDATA_PATH, TESSERACT_PATH
+from ocr import P2TInput, P2TOutput, Settings, analyse_p2t, analyse_tesseract, convert_output, init_worker
+from utils.sorter import Sorter
+
+TESSERACT_LANGS = {'en_text': 'eng', 'ms_text': 'msa', 'en_ms_text': 'eng+msa'}
+SCALED_TYPES = {'text', 'text_formula'}
+ANALYSIS_TYPES = [*TESSERACT_LANGS, 'text', 'formula', 'text_formula', 'pdf']
+
+
+def collect_files(directory: Path, analysis_type: str, recursive: bool = False) -> Iterator[Path]:
+	extensions = {'.pdf'} if analysis_type == 'pdf' else IMAGE_EXTENSIONS
+
+	with os.scandir(directory) as entries:
+		entries = Sorter.sort_entries(entries)
+
+	# Files of a folder in natural order, then its sub-folders in the same order
+	for entry in entries:
+		if entry.is_file() and os.path.splitext(entry.name)[1].lower() in extensions:
+			yield Path(entry.path)
+
+	if recursive:
+		for entry in entries:
+			if entry.is_dir():
+				yield from collect_files(Path(entry.path), analysis_type, recursive)
+
+
+def analyse_file(path: Path, analysis_type: str) -> list[str]:
+	if analysis_type == 'pdf':
+		return analyse_p2t(path, P2TInput.PDF, [P2TOutput.LATEX])[P2TOutput.LATEX.value]
+
+	with open(path, 'rb') as file:
+		image = crop_image(load_image(file, IMAGE_MAX_SIDE, IMAGE_MAX_PIXELS))
+
+	if image is None:
+		return []
+	if IMAGE_TEXT_HEIGHT > 0 and analysis_type in SCALED_TYPES:
+		image = scale_to_text_height(image, IMAGE_TEXT_HEIGHT)
+
+	if analysis_type in TESSERACT_LANGS:
+		settings = Settings(
+			{
+				'TESSERACT_PATH': TESSERACT_PATH,
+				'TESSDATA_PATH': TESSDATA_PATH,
+				'TIMEOUT': 0,
+				'LANG': TESSERACT_LANGS[analysis_type],
+			}
+		)
+		return analyse_tesseract(settings, image)
+
+	return analyse_p2t(image, P2TInput(analysis_type), [P2TOutput.LATEX])[P2TOutput.LATEX.value]
+
+
+def try_analyse_file(path: Path, name: str, analysis_type: str) -> dict:
+	# A broken file is written down and skipped, it never stops the rest of the run
+	try:
+		return {'path': name, 'latex': analyse_file(path, analysis_type)}
+	except Exception as error:
+		return {'path': name, 'error': f'{type(error).__name__}: {error}'}
+
+
+def read_checkpoint(checkpoint: Path) -> set[str]:
+	if not checkpoint.exists():
+		return set()
+
+	with open(checkpoint, encoding='utf-8') as file:
+		return {line.removesuffix('\n') for line in file if line.endswith('\n')}
+
+
+def read_results(output: Path) -> dict[str, list[str]]:
+	results = {}
+
+	with open(output, encoding='utf-8') as file:
+		for line in file:
+			try:
+				result = json.loads(line)
+			except ValueError:
+				continue
+
+			if 'latex' in result:
+				results[result['path']] = result['latex']
+
+	return results
+
+
+def write_docx(files: list[str], output: Path, docx: Path):
+	results = read_results(output)
+	latex = [line for name in files for line in results.get(name, [])]
+
+	with convert_output(latex, P2TOutput.DOCX) as document, open(docx, 'wb') as file:
+		document.seek(0)
+		shutil.copyfileobj(document, file)
+
+
+def run(args: argparse.Namespace):
+	directory = args.directory.resolve()
+	checkpoint = args.checkpoint or args.output.with_name(f'{args.output.name}.checkpoint')
+
+	files = [
+		(path, path.relative_to(directory).as_posix())
+		for path in collect_files(directory, args.type, args.recursive)
+	]
+	done = read_checkpoint(checkpoint)
+	pending = [(path, name) for path, name in files if name not in done]
+	print(f'{len(files)} files found, {len(files) - len(pending)} already done, {len(pending)} to analyse')
+
+	use_p2t = args.type not in TESSERACT_LANGS
+	executor = ProcessPoolExecutor(
+		args.workers,
+		mp_context=multiprocessing.get_context('spawn'),
+		initializer=init_worker if use_p2t else None,
+		initargs=(args.threads,) if use_p2t else (),
+	)
+
+	with executor, open(args.output, 'a', encoding='utf-8') as output, open(checkpoint, 'a', encoding='utf-8') as marks:
+		# A few jobs per worker are kept queued, results are written back in file order as they come in
+		window: deque[Future] = deque()
+		queue = iter(pending)
+		completed = 0
+
+		while True:
+			while len(window) < args.workers * 4 and (item := next(queue, None)) is not None:
+				window.append(executor.submit(try_analyse_file, item[0], item[1], args.type))
+
+			if not window:
+				break
+
+			result = window.popleft().result()
+			output.write(json.dumps(result, ensure_ascii=False) + '\n')
+			output.flush()
+
+			# Marked only once its result is on disk, failed files are left unmarked to be retried next run
+			if 'error' not in result:
+				marks.write(result['path'] + '\n')
+				marks.flush()
+
+			completed += 1
+			status = 'failed' if 'error' in result else 'done'
+			print(f'[{completed}/{len(pending)}] {result["path"]} {status}')
+
+	if args.docx is not None:
+		write_docx([name for _, name in files], args.output, args.docx)
+		print(f'DOCX saved to {args.docx}')
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Analyse every image in a folder, results are written as JSON lines.')
+	parser.add_argument('directory', type=Path, help='Folder of images, or PDF files with --type pdf')
+	parser.add_argument('output', type=Path, help='JSONL file results are appended to')
+	parser.add_argument('--type', choices=ANALYSIS_TYPES, default='text_formula', help='Analysis type')
+	parser.add_argument('--docx', type=Path, help='Also save every result, in file order, to one DOCX file')
+	parser.add_argument('--workers', type=int, default=1, help='Worker processes, each loads its own model')
+	parser.add_argument('--threads', type=int, default=0, help='Torch threads per worker, 0 for default')
+	parser.add_argument('--checkpoint', type=Path, help='Checkpoint file, defaults to the output file + .checkpoint')
+	parser.add_argument('--recursive', action='store_true', help='Include sub-folders')
+	run(parser.parse_args())
+
+
+if __name__ == '__main__':
+	main()
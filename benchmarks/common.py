@@ -0,0 +1,23 @@
+import time
+from typing import Callable
+
+
+def best_time(fn: Callable[[], object], repeat: int = 5) -> float:
+	# Best of a few runs, the least disturbed by the rest of the machine
+	best = float('inf')
+	for _ in range(repeat):
+		start = time.perf_counter()
+		fn()
+		best = min(best, time.perf_counter() - start)
+
+	return best
+
+
+def result(name: str, size: int, value: float, unit: str) -> dict:
+	# Every result is a rate, higher is better, so runs of different commits compare the same way
+	return {'name': name, 'size': size, 'value': value, 'unit': unit}
+
+
+def print_results(results: list[dict]):
+	for entry in results:
+		print(f'{entry["name"]:<36} {entry["size"]:>8} {entry["value"]:>14,.1f} {entry["unit"]}')
@@ -0,0 +1,95 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+# Same server setup on every machine, whatever the .env says, and no model or database is touched
+os.environ.update(
+	{
+		'WITH_AUTH': 'false',
+		'OCR_EXECUTOR': 'thread',
+		'OCR_WARM_UP': 'false',
+		'RESULT_CACHE_BYTES': '0',
+		'RESULT_CACHE_DIR': '',
+		'PROFILE_DIR': '',
+		'DATABASE_URL': 'sqlite://',
+	}
+)
+
+from fastapi.testclient import TestClient
+
+import ocr.p2t
+from backend.main import app
+from common import best_time, print_results, result
+from images import encode, generate_page
+
+OUTPUT = 'Solve $x_{1}^{2} + \\frac{a}{b} = 0$ for $x_{1}$\n$$\\int_{0}^{1} f(x) dx$$'
+
+
+class StubAnalyser:
+	# Stands in for Pix2Text with a fixed answer, so only the server's own work is measured
+	def analyse(self, image, type='text_formula'):
+		return OUTPUT if type != 'formula' else 'x^{2} + 1'
+
+	def analyse_batch(self, images, type='text_formula'):
+		return [self.analyse(image, type) for image in images]
+
+
+def benchmark_analyse(client: TestClient, width: int, height: int, formats: list[str], repeat: int = 3) -> float:
+	data = encode(generate_page(width, height), 'PNG')
+	requests = 10
+
+	def analyse():
+		for _ in range(requests):
+			response = client.post(
+				'/analyse',
+				files={'file': ('page.png', data, 'image/png')},
+				data={'analysis_type': 'text_formula', 'formats': formats},
+			)
+			response.raise_for_status()
+
+	return requests / best_time(analyse, repeat)
+
+
+def benchmark_download(client: TestClient, count: int, repeat: int = 3) -> float:
+	latex = [line for i in range(count) for line in ('Solve ', rf'\begin{{math}}x_{{{i}}}^{{2}} + 1\end{{math}}')]
+
+	def download():
+		ocr.p2t.formatter.cached_latex_to_mathml.cache_clear()
+		ocr.p2t.formatter.cached_latex_to_omml.cache_clear()
+		client.post('/download', data={'latex': latex}).raise_for_status()
+
+	return count / best_time(download, repeat)
+
+
+def results() -> list[dict]:
+	ocr.p2t.analyser = StubAnalyser()
+	ocr.p2t.warmed_up = True
+
+	# Started as a context manager so the lifespan sets up the result cache like the real server
+	with TestClient(app) as client:
+		return [
+			result('endpoints.analyse_latex', 640 * 480, benchmark_analyse(client, 640, 480, ['latex']), 'requests/s'),
+			result(
+				'endpoints.analyse_all_formats',
+				640 * 480,
+				benchmark_analyse(client, 640, 480, ['latex', 'mathml', 'omml']),
+				'requests/s',
+			),
+			result(
+				'endpoints.analyse_latex',
+				1920 * 1080,
+				benchmark_analyse(client, 1920, 1080, ['latex']),
+				'requests/s',
+			),
+			result('endpoints.download', 100, benchmark_download(client, 100), 'formulas/s'),
+		]
+
+
+def main():
+	print_results(results())
+
+
+if __name__ == '__main__':
+	main()
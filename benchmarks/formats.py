@@ -0,0 +1,56 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from common import best_time, print_results, result
+from ocr.p2t import FormatConverter, P2TOutput, convert_output, formatter
+
+FORMULAS = [
+	r'x_{{{i}}}^{{2}} + \frac{{a}}{{b_{{{i}}}}} = \sqrt{{y + {i}}}',
+	r'\int_{{0}}^{{{i}}} f(x) dx = \sum_{{k=1}}^{{n}} k^{{{i}}}',
+	r'\left( \alpha + \beta_{{{i}}} \right) \times \begin{{matrix}} a & b \\ c & {i} \end{{matrix}}',
+]
+
+
+def generate_formulas(count: int) -> list[str]:
+	# Every formula is distinct, so the converter caches never answer for the benchmark
+	return [rf'\begin{{math}}{FORMULAS[i % len(FORMULAS)].format(i=i)}\end{{math}}' for i in range(count)]
+
+
+def benchmark_convert(count: int, repeat: int = 3) -> float:
+	converter = FormatConverter()
+	formulas = generate_formulas(count)
+
+	def convert():
+		for latex in formulas:
+			mathml = converter.convert_mathml_to_xml(converter.latex_to_mathml(latex))
+			converter.convert_mathmlxml_to_omml(mathml)
+
+	return count / best_time(convert, repeat)
+
+
+def benchmark_docx(count: int, repeat: int = 3) -> float:
+	results = [line for formula in generate_formulas(count) for line in ('Solve ', formula)]
+
+	def export():
+		formatter.cached_latex_to_mathml.cache_clear()
+		formatter.cached_latex_to_omml.cache_clear()
+		convert_output(results, P2TOutput.DOCX).close()
+
+	return count / best_time(export, repeat)
+
+
+def results() -> list[dict]:
+	return [
+		*(result('formats.latex_to_omml', count, benchmark_convert(count), 'formulas/s') for count in [10, 100, 500]),
+		*(result('formats.convert_output_docx', count, benchmark_docx(count), 'formulas/s') for count in [10, 100, 500]),
+	]
+
+
+def main():
+	print_results(results())
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,71 @@
+import random
+import sys
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from backend.image_operation import MAX_IMAGE_SIDE, crop_image, load_image, scale_to_text_height
+from common import best_time, print_results, result
+
+SIZES = [(640, 480), (1920, 1080), (3000, 4000)]
+
+
+def generate_page(width: int, height: int, seed: int = 0) -> Image.Image:
+	# Lines of dark blocks inside a white margin, roughly what a photographed page looks like to crop_image
+	generator = random.Random(seed)
+	image = Image.new('RGB', (width, height), 'white')
+	draw = ImageDraw.Draw(image)
+
+	line_height = max(height // 40, 8)
+	for top in range(height // 10, height * 9 // 10, line_height * 2):
+		left = width // 10
+		while left < width * 9 // 10:
+			word = generator.randint(line_height, line_height * 4)
+			draw.rectangle((left, top, left + word, top + line_height), fill=(20, 20, 20))
+			left += word + line_height
+
+	return image
+
+
+def encode(image: Image.Image, format: str) -> bytes:
+	buffer = BytesIO()
+	image.save(buffer, format)
+	return buffer.getvalue()
+
+
+def benchmark_load(width: int, height: int, format: str, repeat: int = 3) -> float:
+	data = encode(generate_page(width, height), format)
+	return width * height / 1e6 / best_time(lambda: load_image(BytesIO(data), MAX_IMAGE_SIDE), repeat)
+
+
+def benchmark_crop(width: int, height: int, repeat: int = 3) -> float:
+	image = generate_page(width, height)
+	return width * height / 1e6 / best_time(lambda: crop_image(image), repeat)
+
+
+def benchmark_scale(width: int, height: int, repeat: int = 3) -> float:
+	image = generate_page(width, height)
+	return width * height / 1e6 / best_time(lambda: scale_to_text_height(image, 40), repeat)
+
+
+def results() -> list[dict]:
+	entries = []
+	for width, height in SIZES:
+		pixels = width * height
+		entries.append(result('images.load_image_png', pixels, benchmark_load(width, height, 'PNG'), 'megapixels/s'))
+		entries.append(result('images.load_image_jpeg', pixels, benchmark_load(width, height, 'JPEG'), 'megapixels/s'))
+		entries.append(result('images.crop_image', pixels, benchmark_crop(width, height), 'megapixels/s'))
+		entries.append(result('images.scale_to_text_height', pixels, benchmark_scale(width, height), 'megapixels/s'))
+
+	return entries
+
+
+def main():
+	print_results(results())
+
+
+if __name__ == '__main__':
+	main()
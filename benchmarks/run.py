@@ -0,0 +1,78 @@
+import argparse
+import importlib
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from common import print_results
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+
+# Imported only when run, endpoints sets up the server environment as it is imported
+SUITES = ['sanitiser', 'formats', 'images', 'sorter', 'endpoints']
+
+
+def git_commit() -> str:
+	try:
+		output = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True, text=True)
+		return output.stdout.strip() or 'unknown'
+	except OSError:
+		return 'unknown'
+
+
+def compare(results: list[dict], baseline: Path):
+	with open(baseline, encoding='utf-8') as file:
+		previous = {(entry['name'], entry['size']): entry['value'] for entry in json.load(file)['results']}
+
+	# Every result is a rate, so below 1.00x is slower than the baseline
+	print(f'\nCompared with {baseline}')
+	for entry in results:
+		old = previous.get((entry['name'], entry['size']))
+		if old:
+			print(f'{entry["name"]:<36} {entry["size"]:>8} {entry["value"] / old:>8.2f}x')
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Run the benchmarks offline and save the results as JSON.')
+	parser.add_argument('suites', nargs='*', help=f'Suites to run, all of them by default: {", ".join(SUITES)}')
+	parser.add_argument('--output', type=Path, help='Results file, defaults to benchmarks/results/<commit>.json')
+	parser.add_argument('--compare', type=Path, help='Earlier results file to compare with')
+	args = parser.parse_args()
+
+	unknown = [name for name in args.suites if name not in SUITES]
+	if unknown:
+		parser.error(f'unknown suites: {", ".join(unknown)}')
+
+	results = []
+	for name in args.suites or SUITES:
+		print(f'Running {name}...')
+		results.extend(importlib.import_module(name).results())
+
+	commit = git_commit()
+	output = args.output or BASE_DIR / 'benchmarks' / 'results' / f'{commit}.json'
+	output.parent.mkdir(parents=True, exist_ok=True)
+	report = {
+		'commit': commit,
+		'created': datetime.now().isoformat(timespec='seconds'),
+		'python': platform.python_version(),
+		'machine': platform.platform(),
+		'processor': platform.processor() or platform.machine(),
+		'results': results,
+	}
+	output.write_text(json.dumps(report, indent=2), encoding='utf-8')
+
+	print()
+	print_results(results)
+	print(f'\nResults saved to {output}')
+
+	if args.compare is not None:
+		compare(results, args.compare)
+
+
+if __name__ == '__main__':
+	main()
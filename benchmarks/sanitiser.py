@@ -0,0 +1,58 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from common import best_time, print_results, result
+from ocr.sanitiser import Sanitiser
+
+LINES = [
+	r'Solve the following equations for $x$ and $y$:',
+	r'$$\left( x^{2} + \frac{a}{b} \right) = \sqrt{y_{1} + y_{2}}$$',
+	r'Given $f(x) = 3x^{2} - 2x + 1$, find $f^{\prime}(2)$ and $\int_{0}^{1} f(x) dx$.',
+	r'$$\begin{matrix} a & b \\ c & d \end{matrix}$$',
+	r'$$\begin{array}{cc} 1 & 2 \\ 3 & 4 \end{array}$$',
+	r'Hence $\left\{ x \in \mathbb{R} : x > 0 \right.$ and \textcircled{1} holds.',
+]
+
+
+def generate_output(lines: int) -> str:
+	return '\n'.join(LINES[i % len(LINES)] for i in range(lines))
+
+
+def generate_formula(terms: int) -> str:
+	# Nested groups with every few of them left open, the worst case for fix_syntax
+	parts = []
+	for i in range(terms):
+		parts.append(r'\left( \frac{x_{' + str(i) + r'}}{2} + ' if i % 3 == 0 else r'{a^{' + str(i) + r'} + ')
+		if i % 5 == 4:
+			parts.append(r'\right) ')
+
+	return Sanitiser.MATH_BEGIN + ''.join(parts) + Sanitiser.MATH_END
+
+
+def benchmark(lines: int, repeat: int = 5) -> float:
+	sanitiser = Sanitiser()
+	text = generate_output(lines)
+	return lines / best_time(lambda: sanitiser.clean_mix_output(text), repeat)
+
+
+def benchmark_fix_syntax(terms: int, repeat: int = 5) -> float:
+	sanitiser = Sanitiser()
+	formula = generate_formula(terms)
+	return terms / best_time(lambda: sanitiser.fix_syntax(formula), repeat)
+
+
+def results() -> list[dict]:
+	return [
+		*(result('sanitiser.clean_mix_output', lines, benchmark(lines), 'lines/s') for lines in [10, 100, 1000, 5000]),
+		*(result('sanitiser.fix_syntax', terms, benchmark_fix_syntax(terms), 'terms/s') for terms in [10, 100, 1000]),
+	]
+
+
+def main():
+	print_results(results())
+
+
+if __name__ == '__main__':
+	main()
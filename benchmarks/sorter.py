@@ -0,0 +1,59 @@
+import os
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from common import best_time, print_results, result
+from utils.sorter import Sorter
+
+PATTERNS = [
+	'scan_{volume}_page{page}.png',
+	'Chapter {volume}.{page} exercises.jpg',
+	'IMG_{volume:04d}{page:03d}.jpeg',
+	'page-{page}.png',
+	'{volume}-{page}b.png',
+]
+
+
+def generate_names(count: int, seed: int = 0) -> list[str]:
+	generator = random.Random(seed)
+	return [
+		generator.choice(PATTERNS).format(volume=generator.randint(0, 9999), page=generator.randint(1, 300))
+		for _ in range(count)
+	]
+
+
+def benchmark_paths(count: int, repeat: int = 3) -> float:
+	paths = [Path(name) for name in generate_names(count)]
+	return count / best_time(lambda: Sorter.sort_paths(paths), repeat)
+
+
+def benchmark_scandir(count: int, repeat: int = 3) -> float:
+	with tempfile.TemporaryDirectory() as directory:
+		names = set(generate_names(count))
+		for name in names:
+			Path(directory, name).touch()
+
+		def sort_entries():
+			with os.scandir(directory) as entries:
+				Sorter.sort_entries(entries)
+
+		return len(names) / best_time(sort_entries, repeat)
+
+
+def results() -> list[dict]:
+	return [
+		*(result('sorter.sort_paths', count, benchmark_paths(count), 'paths/s') for count in [1000, 10000, 100000]),
+		result('sorter.sort_entries', 10000, benchmark_scandir(10000), 'files/s'),
+	]
+
+
+def main():
+	print_results(results())
+
+
+if __name__ == '__main__':
+	main()
@@ -1,2 +1,14 @@
-from .p2t import P2TOutput, analyse_p2t, convert_output
-from .tesseract import Settings, analyse_tesseract
+from .p2t import (
+	P2TInput,
+	P2TOutput,
+	P2TResult,
+	analyse_p2t,
+	analyse_pdf_page,
+	analyse_p2t_batch,
+	convert_output,
+	formatter,
+	init_worker,
+	warm_up,
+)
+from .pdf import count_pages
+from .tesseract import Settings, TesseractError, analyse_tesseract
@@ -1,62 +1,96 @@
+import threading
+from collections.abc import Mapping
+from concurrent.futures import Executor
+from copy import deepcopy
 from enum import Enum
-from io import BytesIO
+from functools import lru_cache
 from pathlib import Path
-from typing import Literal
+from tempfile import SpooledTemporaryFile
+from typing import IO, TYPE_CHECKING, Literal
 
 import latex2mathml.converter
 import latex2mathml.exceptions
 from docx import Document
 from lxml import etree
+from PIL import Image, ImageDraw
 from PIL.Image import Image as ImageType
-from pix2text import Pix2Text
 
+from ocr.pdf import PDF_DPI, PDF_MAX_SIDE, iter_pages, render_page
 from ocr.sanitiser import Sanitiser
+from ocr.stages import stage
+
+if TYPE_CHECKING:
+	from pix2text import Pix2Text
 
 FILE_DIR = Path(__file__).resolve().parent
 BASE_DIR = FILE_DIR.parent
+PARALLEL_EXPORT_MIN_FORMULAS = 32
+EXPORT_CHUNK_SIZE = 8
+EXPORT_SPOOL_SIZE = 8 * 1024 * 1024
 
 
 class FormatConverter:
-	def __init__(self):
+	def __init__(self, cache_size: int = 1024):
 		self.mathml_to_omml = etree.XSLT(etree.parse(BASE_DIR / 'data' / 'MML2OMML.XSL'))  # NOSONAR
 
+		# Same formulas are converted again on download, keep the recent ones
+		self.cached_latex_to_mathml = lru_cache(maxsize=cache_size)(self.latex_to_mathml)
+		self.cached_latex_to_omml = lru_cache(maxsize=cache_size)(self.latex_to_omml)
+
 	def latex_to_mathml(self, latex: str) -> str:
-		mathml = latex2mathml.converter.convert(latex)
-		mathml = mathml.replace(' display="inline"', '')
-		return mathml
+		with stage('latex_to_mathml'):
+			mathml = latex2mathml.converter.convert(latex)
+			mathml = mathml.replace(' display="inline"', '')
+			return mathml
+
+	def latex_to_omml(self, latex: str) -> etree._XSLTResultTree:
+		output = self.convert_latex_to_mathml(latex)
+		output = self.convert_mathml_to_xml(output)
+		return self.convert_mathmlxml_to_omml(output)
 
 	def convert_latex_to_mathml(self, latex: str) -> str:
-		return self.latex_to_mathml(latex)
+		return self.cached_latex_to_mathml(latex)
+
+	def convert_latex_to_omml(self, latex: str) -> etree._XSLTResultTree:
+		return self.cached_latex_to_omml(latex)
 
 	def convert_mathml_to_xml(self, mathml: str) -> etree._ElementTree:
 		return etree.fromstring(mathml)
 
 	def convert_mathmlxml_to_omml(self, mathml: etree._ElementTree) -> etree._ElementTree:
-		return self.mathml_to_omml(mathml)
+		with stage('mathml_to_omml'):
+			return self.mathml_to_omml(mathml)
 
 	def convert_omml_to_docx_element(self, omml: etree._ElementTree) -> etree._Element:
-		return omml.getroot()
+		# Cached trees are shared, appending the root itself would move it out of the cache
+		return deepcopy(omml.getroot())
 
 	def try_convert_latex_to_mathml(self, latex: str) -> str:
 		try:
-			return formatter.convert_latex_to_mathml(latex)
+			return self.convert_latex_to_mathml(latex)
 		except Exception:
 			return latex
 
 	def try_convert_latex_to_omml(self, latex: str) -> str:
 		try:
-			output = formatter.convert_latex_to_mathml(latex)
-			output = formatter.convert_mathml_to_xml(output)
-			output = formatter.convert_mathmlxml_to_omml(output)
-			return str(output)
+			return str(self.convert_latex_to_omml(latex))
 		except Exception:
 			return latex
 
+	def cache_info(self) -> dict[str, dict[str, int]]:
+		return {
+			'mathml': self.cached_latex_to_mathml.cache_info()._asdict(),
+			'omml': self.cached_latex_to_omml.cache_info()._asdict(),
+		}
+
 
 class P2TAnalyser:
-	model = Pix2Text
+	model: 'Pix2Text'
 
 	def __init__(self, languages=('en',)):
+		# Imported here so importing ocr does not pull in torch and the models
+		from pix2text import Pix2Text
+
 		self.model = Pix2Text.from_config(languages=languages)
 
 	def analyse(
@@ -64,8 +98,31 @@ class P2TAnalyser:
 		image: ImageType,
 		type: Literal['text', 'formula', 'text_formula', 'page', 'pdf'] = 'text_formula',
 	):
-		result = self.model.recognize(image, file_type=type)
-		return result
+		with stage('recognize'):
+			result = self.model.recognize(image, file_type=type)
+			return result
+
+	def analyse_batch(
+		self,
+		images: list[ImageType],
+		type: Literal['text', 'formula', 'text_formula', 'page'] = 'text_formula',
+	) -> list:
+		# Errors are returned in place of their image, so one bad image never fails the rest of the batch
+		with stage('recognize'):
+			if type == 'formula':
+				try:
+					return self.model.recognize_formula(images, batch_size=len(images))
+				except Exception:
+					# Only formula recognition accepts a list of images, on failure find the bad one image by image
+					pass
+
+			return [self.try_analyse(image, type) for image in images]
+
+	def try_analyse(self, image: ImageType, type: str) -> str | Exception:
+		try:
+			return self.model.recognize(image, file_type=type)
+		except Exception as error:
+			return error
 
 
 class P2TInput(Enum):
@@ -83,12 +140,61 @@ class P2TOutput(Enum):
 	DOCX = 'docx'
 
 
-analyser = P2TAnalyser()
+analyser: P2TAnalyser | None = None
+analyser_lock = threading.Lock()
+warmed_up = False
 formatter = FormatConverter()
 sanitiser = Sanitiser()
 
 
-def convert_output(results: list[str], output_type: P2TOutput) -> list[str] | BytesIO:
+def get_analyser() -> P2TAnalyser:
+	global analyser
+
+	# Model is only loaded by the process that actually runs the analysis
+	if analyser is None:
+		with analyser_lock:
+			if analyser is None:
+				analyser = P2TAnalyser()
+
+	return analyser
+
+
+def warm_up() -> bool:
+	global warmed_up
+
+	if warmed_up:
+		return True
+
+	# First inference initialises the lazy parts of the models, run it on a synthetic image
+	image = Image.new(mode='RGB', size=(256, 64), color=(255, 255, 255))
+	ImageDraw.Draw(image).text((16, 24), 'x = a + 1', fill=(0, 0, 0))
+	get_analyser().analyse(image, P2TInput.TEXT_FORMULA.value)
+
+	warmed_up = True
+	return warmed_up
+
+
+def init_worker(num_threads: int = 0):
+	if num_threads > 0:
+		try:
+			import torch
+
+			torch.set_num_threads(num_threads)
+		except ImportError:
+			pass
+
+	warm_up()
+
+
+def latex_to_omml_string(latex: str) -> str:
+	return str(formatter.convert_latex_to_omml(latex))
+
+
+def convert_output(
+	results: list[str],
+	output_type: P2TOutput,
+	executor: Executor | None = None,
+) -> list[str] | IO[bytes]:
 	match output_type:
 		case P2TOutput.LATEX:
 			return results
@@ -104,44 +210,135 @@ def convert_output(results: list[str], output_type: P2TOutput) -> list[str] | By
 			]
 
 		case P2TOutput.DOCX:
-			document = Document()
-			p = document.add_paragraph()
-
-			for result in results:
-				if result.startswith(Sanitiser.MATH_BEGIN):
-					result = formatter.convert_latex_to_mathml(result)
-					result = formatter.convert_mathml_to_xml(result)
-					result = formatter.convert_mathmlxml_to_omml(result)
-					result = formatter.convert_omml_to_docx_element(result)
-					p._element.append(result)
+			with stage('docx'):
+				formulas = list(dict.fromkeys(result for result in results if result.startswith(Sanitiser.MATH_BEGIN)))
+
+				# Convert each distinct formula once, spread over the executor when there are many of them
+				if executor is not None and len(formulas) >= PARALLEL_EXPORT_MIN_FORMULAS:
+					converted = executor.map(latex_to_omml_string, formulas, chunksize=EXPORT_CHUNK_SIZE)
+					omml = {
+						latex: etree.ElementTree(etree.fromstring(output))  #
+						for latex, output in zip(formulas, converted)
+					}
 				else:
-					p.add_run(result)
+					omml = {latex: formatter.convert_latex_to_omml(latex) for latex in formulas}
 
-			file_stream = BytesIO()
-			document.save(file_stream)
+				document = Document()
+				p = document.add_paragraph()
 
-			return file_stream
+				for result in results:
+					if result in omml:
+						p._element.append(formatter.convert_omml_to_docx_element(omml[result]))
+					else:
+						p.add_run(result)
 
+				# Large documents are spooled to disk instead of being held in memory until streamed
+				file_stream = SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+				document.save(file_stream)
 
-def analyse_p2t(
-	image: ImageType | Path,
+				return file_stream
+
+
+class P2TResult(Mapping):
+	def __init__(self, latex: list[str]):
+		self.latex = latex
+		self.outputs: dict[P2TOutput, list[str]] = {P2TOutput.LATEX: latex}
+
+	def __getitem__(self, key: str | P2TOutput) -> list[str] | IO[bytes]:
+		output_type = P2TOutput(key)
+
+		# Each format is only converted when it is read, DOCX streams are not kept
+		if output_type == P2TOutput.DOCX:
+			return convert_output(self.latex, output_type)
+		if output_type not in self.outputs:
+			self.outputs[output_type] = convert_output(self.latex, output_type)
+
+		return self.outputs[output_type]
+
+	def __iter__(self):
+		return (output_type.value for output_type in P2TOutput)
+
+	def __len__(self) -> int:
+		return len(P2TOutput)
+
+	def select(self, output_types: list[P2TOutput]) -> dict[str, list[str] | IO[bytes]]:
+		return {output_type.value: self[output_type] for output_type in output_types}
+
+
+def process_results(
+	results,
 	input_type: P2TInput = P2TInput.TEXT_FORMULA,
 	output_type: P2TOutput | list[P2TOutput] = P2TOutput.LATEX,
-) -> list[str] | BytesIO | dict[str, list[str] | BytesIO]:
-	results = analyser.analyse(image, input_type.value)
-
-	match input_type.value:
-		case P2TInput.TEXT_FORMULA.value | P2TInput.FORMULA.value:
-			results = sanitiser.clean_mix_output(results)
-		case P2TInput.TEXT.value:
-			results = [results]
-		case P2TInput.PDF.value:
-			results.to_markdown('output-pdf-md')
-		case _:
-			raise NotImplementedError('Input Not Implemented!')
-
+) -> list[str] | IO[bytes] | P2TResult:
+	with stage('sanitise'):
+		match input_type.value:
+			case P2TInput.TEXT_FORMULA.value:
+				results = sanitiser.clean_mix_output(results)
+			case P2TInput.FORMULA.value:
+				# Formula recognition returns bare LaTeX, delimit it so it is sanitised as math
+				results = sanitiser.clean_mix_output(f'{Sanitiser.MATH_CHECKER}{results}{Sanitiser.MATH_CHECKER}')
+			case P2TInput.TEXT.value:
+				results = [results]
+			case P2TInput.PDF.value:
+				# Each page is recognised as mixed text and formula, then joined in page order
+				results = [line for page in results for line in sanitiser.clean_mix_output(page)]
+			case _:
+				raise NotImplementedError('Input Not Implemented!')
+
+	# Formats of a list output are converted lazily when read from the result
 	if isinstance(output_type, list):
-		outputs = {out_type.value: convert_output(results, out_type) for out_type in output_type}
-		return outputs
+		return P2TResult(results)
 
 	return convert_output(results, output_type)
+
+
+def analyse_p2t(
+	image: ImageType | Path | bytes,
+	input_type: P2TInput = P2TInput.TEXT_FORMULA,
+	output_type: P2TOutput | list[P2TOutput] = P2TOutput.LATEX,
+) -> list[str] | IO[bytes] | P2TResult:
+	if input_type == P2TInput.PDF:
+		analyser = get_analyser()
+		results = [analyser.analyse(page, P2TInput.TEXT_FORMULA.value) for page in iter_pages(image)]
+	else:
+		results = get_analyser().analyse(image, input_type.value)
+
+	return process_results(results, input_type, output_type)
+
+
+def analyse_pdf_page(
+	document: bytes | Path,
+	page_number: int,
+	output_type: P2TOutput | list[P2TOutput] = P2TOutput.LATEX,
+	dpi: int = PDF_DPI,
+	max_side: int = PDF_MAX_SIDE,
+	max_pixels: int = 0,
+) -> list[str] | IO[bytes] | P2TResult:
+	# Rendered inside the worker, so only the document is sent over and pages are rasterised on demand
+	with stage('pdf_render'):
+		image = render_page(document, page_number, dpi, max_side, max_pixels)
+	results = get_analyser().analyse(image, P2TInput.TEXT_FORMULA.value)
+	return process_results([results], P2TInput.PDF, output_type)
+
+
+def analyse_p2t_batch(
+	images: list[ImageType],
+	input_type: P2TInput = P2TInput.TEXT_FORMULA,
+	output_type: P2TOutput | list[P2TOutput] = P2TOutput.LATEX,
+) -> list[list[str] | IO[bytes] | P2TResult]:
+	results = get_analyser().analyse_batch(images, input_type.value)
+	return [try_process_results(result, input_type, output_type) for result in results]
+
+
+def try_process_results(
+	result,
+	input_type: P2TInput = P2TInput.TEXT_FORMULA,
+	output_type: P2TOutput | list[P2TOutput] = P2TOutput.LATEX,
+) -> list[str] | IO[bytes] | P2TResult | Exception:
+	if isinstance(result, Exception):
+		return result
+
+	try:
+		return process_results(result, input_type, output_type)
+	except Exception as error:
+		return error
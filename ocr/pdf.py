@@ -0,0 +1,66 @@
+import math
+from pathlib import Path
+from typing import Iterator
+
+import pymupdf
+from PIL import Image
+from PIL.Image import Image as ImageType
+
+PDF_DPI = 150
+PDF_MAX_SIDE = 4096
+
+
+def open_pdf(document: bytes | Path) -> pymupdf.Document:
+	if isinstance(document, Path):
+		return pymupdf.open(document)
+
+	return pymupdf.open(stream=document, filetype='pdf')
+
+
+def count_pages(document: bytes | Path) -> int:
+	with open_pdf(document) as pdf:
+		return pdf.page_count
+
+
+def page_zoom(page: pymupdf.Page, dpi: int, max_side: int = PDF_MAX_SIDE, max_pixels: int = 0) -> float:
+	# Page size is in points, 72 per inch, a huge page is rendered at a lower resolution instead of a huge raster
+	width, height = page.rect.width, page.rect.height
+	zoom = dpi / 72
+
+	if max_side > 0 and max(width, height) > 0:
+		zoom = min(zoom, max_side / max(width, height))
+	if max_pixels > 0 and width * height > 0:
+		# Each side is rounded up to a whole pixel, solved from (width * zoom + 1) * (height * zoom + 1) <= max_pixels
+		area, perimeter = width * height, width + height
+		zoom = min(zoom, (math.sqrt(perimeter**2 + 4 * area * (max_pixels - 1)) - perimeter) / (2 * area))
+
+	return zoom
+
+
+def to_image(page: pymupdf.Page, dpi: int = PDF_DPI, max_side: int = PDF_MAX_SIDE, max_pixels: int = 0) -> ImageType:
+	zoom = page_zoom(page, dpi, max_side, max_pixels)
+	pixmap = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+	return Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+
+
+def render_page(
+	document: bytes | Path,
+	page_number: int,
+	dpi: int = PDF_DPI,
+	max_side: int = PDF_MAX_SIDE,
+	max_pixels: int = 0,
+) -> ImageType:
+	with open_pdf(document) as pdf:
+		return to_image(pdf[page_number], dpi, max_side, max_pixels)
+
+
+def iter_pages(
+	document: bytes | Path,
+	dpi: int = PDF_DPI,
+	max_side: int = PDF_MAX_SIDE,
+	max_pixels: int = 0,
+) -> Iterator[ImageType]:
+	# Pages are only rasterised when asked for, a long document never sits in memory as images
+	with open_pdf(document) as pdf:
+		for page in pdf:
+			yield to_image(page, dpi, max_side, max_pixels)
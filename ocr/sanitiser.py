@@ -1,5 +1,5 @@
-import math
 import re
+from typing import Iterator
 
 
 class Sanitiser:
@@ -18,12 +18,18 @@ class Sanitiser:
 	UNCLOSED_REPLACE = {
 		r'\right': r'\right.',
 	}
-	EMPTY = [
-		'',
-		'\n',
-		f'{MATH_BEGIN}{MATH_END}',
-		f'{MATH_BEGIN} {MATH_END}',
-	]
+	MATH_DELIMITER = re.compile(rf'(?P<display>\{MATH_CHECKER}{{2}})|(?P<inline>\{MATH_CHECKER})')
+	SYNTAX_TOKEN = re.compile(r'(?<!\\)(' + '|'.join(map(re.escape, [*SYNTAX, *SYNTAX.values()])) + ')')
+	MATRIX_SYNTAX = re.compile(rf'({re.escape(MATRIX_BEGIN)}|{re.escape(MATRIX_END)})')
+	ALIGNMENT = re.compile(r'([^\\])&')
+	EMPTY = frozenset(
+		[
+			'',
+			'\n',
+			f'{MATH_BEGIN}{MATH_END}',
+			f'{MATH_BEGIN} {MATH_END}',
+		]
+	)
 	UNRECOGNISED = [
 		r'\textcircled',
 	]
@@ -31,98 +37,78 @@ class Sanitiser:
 	def assign_math(self, text: str) -> str:
 		math = [self.MATH_BEGIN, self.MATH_END]
 		math_open = 0
-		while self.MATH_CHECKER in text:
-			text = re.sub(rf'\{self.MATH_CHECKER}+', rf'\{math[math_open]}', text, 1)
+
+		# Display ($$) and inline ($) delimiters both toggle the same math environment, both are output as inline math
+		def replace(matched: re.Match) -> str:
+			nonlocal math_open
+			delimiter = math[math_open]
 			math_open ^= 1
-		return text
+			return delimiter
+
+		return self.MATH_DELIMITER.sub(replace, text)
 
-	def split(self, text: str) -> list[str]:
+	def split(self, text: str) -> Iterator[str]:
 		splitted = text.split(self.MATH_END)
-		for i in range(len(splitted) - 1):
-			splitted[i] += self.MATH_END
+		last = len(splitted) - 1
 
-		splitted = [split.split(self.MATH_BEGIN) for split in splitted if split != '']
-		for i in range(len(splitted)):
-			for j in range(1, len(splitted[i])):
-				splitted[i][j] = self.MATH_BEGIN + splitted[i][j]
+		for i, split in enumerate(splitted):
+			if i < last:
+				split += self.MATH_END
 
-		splitted = [x for split in splitted for x in split]
-		splitted = filter(lambda x: x not in self.EMPTY, splitted)
-		return list(splitted)
+			first, *maths = split.split(self.MATH_BEGIN)
+			if first not in self.EMPTY:
+				yield first
+
+			for math in maths:
+				math = self.MATH_BEGIN + math
+				if math not in self.EMPTY:
+					yield math
 
 	def fix_syntax(self, text: str) -> str:
-		cleaned_text = ''
+		cleaned_text = []
 		syntax_stack = []
 
-		i = 0
-		line_length = len(text)
-		while i < line_length:
-			sliced = text[i:]
+		# Stack positions of each closer, so the nearest open one is found without searching the stack
+		closer_positions = {closer: [] for closer in self.SYNTAX.values()}
+
+		# Every syntax token not escaped by a backslash, visited left to right in one pass
+		last_index = 0
+		for matched in self.SYNTAX_TOKEN.finditer(text):
+			token = matched.group()
+			cleaned_text.append(text[last_index : matched.start()])
+			last_index = matched.end()
 
 			# Correct closer syntax
-			if len(syntax_stack) > 0 and sliced.startswith(syntax_stack[-1]):
-				add = syntax_stack.pop()
-				cleaned_text += add
-				i += len(add)
+			if len(syntax_stack) > 0 and syntax_stack[-1] == token:
+				closer_positions[token].pop()
+				cleaned_text.append(syntax_stack.pop())
 				continue
 
 			# Have unclosed syntax, also close them first
-			is_closer = False
-			temp_stack = []
-			for j in range(len(syntax_stack) - 1, -1, -1):
-				temp_stack.append(syntax_stack[j])
-				if sliced.startswith(syntax_stack[j]):
-					is_closer = True
-					break
-
-			if is_closer:
-				for k in range(len(temp_stack) - 1):
-					if temp_stack[k] in self.UNCLOSED_REPLACE:
-						temp_stack[k] = self.UNCLOSED_REPLACE[temp_stack[k]]
-
-				cleaned_text += ' '.join(temp_stack)
-				i += len(temp_stack[-1])
-				syntax_stack = syntax_stack[0:j]
+			positions = closer_positions.get(token)
+			if positions:
+				j = positions.pop()
+				unclosed = syntax_stack[:j:-1]
+				for closer in unclosed:
+					closer_positions[closer].pop()
+
+				cleaned_text.append(' '.join([*(self.UNCLOSED_REPLACE.get(closer, closer) for closer in unclosed), token]))
+				del syntax_stack[j:]
 				continue
 
-			# Closer syntax without opener, skip it
-			is_closer = False
-			for closer in self.SYNTAX.values():
-				if sliced.startswith(closer):
-					is_closer = True
-					i += len(closer)
-					break
+			# Record syntax into stack, closer syntax without opener is skipped
+			if token in self.SYNTAX:
+				closer = self.SYNTAX[token]
+				cleaned_text.append(token)
+				closer_positions[closer].append(len(syntax_stack))
+				syntax_stack.append(closer)
 
-			if is_closer:
-				continue
-
-			# Record syntax into stack
-			is_syntax = False
-			for opener, closer in self.SYNTAX.items():
-				if sliced.startswith(opener):
-					cleaned_text += opener
-					syntax_stack.append(closer)
-					is_syntax = True
-					i += len(opener)
-					break
-
-			if is_syntax:
-				continue
-
-			# If not syntax, find location of the next syntax
-			next_index = math.inf
-			for opener, closer in self.SYNTAX.items():
-				for search_text in [opener, closer]:
-					matched = re.search(rf'[^\\]{search_text.replace("\\", r"\\")}', sliced)
-					if matched is not None:
-						next_index = min(matched.start() + 1, next_index)
-
-			cleaned_text += sliced[0:next_index]
-			i += next_index
+		cleaned_text.append(text[last_index:])
+		cleaned_text = ''.join(cleaned_text)
 
 		# Close all unclosed syntax
-		for unclosed in syntax_stack[::-1]:
-			unclosed = self.UNCLOSED_REPLACE.get(unclosed, unclosed)
+		if len(syntax_stack) > 0:
+			unclosed = ' '.join(self.UNCLOSED_REPLACE.get(closer, closer) for closer in syntax_stack[::-1])
 			cleaned_text = cleaned_text.replace(self.MATH_END, f'{unclosed} {self.MATH_END}')
 
 		# Remove unrecognised syntax
@@ -131,39 +117,34 @@ class Sanitiser:
 
 		return cleaned_text
 
-	def process_line(self, line: str) -> list[str]:
+	def process_line(self, line: str) -> Iterator[str]:
 		if self.MATH_BEGIN not in line:
-			return line.splitlines()
+			yield from line.splitlines()
+			return
 
-		lines = [
-			re.sub(rf'(\{self.MATRIX_BEGIN}|\{self.MATRIX_END})', '', text)
-			for row in line.splitlines()
-			for text in row.split(self.MATRIX_NEWLINE)
-		]
+		for row in line.splitlines():
+			for text in row.split(self.MATRIX_NEWLINE):
+				text = self.MATRIX_SYNTAX.sub('', text)
 
-		for i in range(len(lines)):
-			if not lines[i].startswith(self.MATH_BEGIN):
-				lines[i] = self.MATH_BEGIN + lines[i]
-			if not lines[i].endswith(self.MATH_END):
-				lines[i] += self.MATH_END
+				if not text.startswith(self.MATH_BEGIN):
+					text = self.MATH_BEGIN + text
+				if not text.endswith(self.MATH_END):
+					text += self.MATH_END
 
-			if self.ARRAY_BEGIN in lines[i] and self.ARRAY_END not in lines[i]:
-				lines[i] = lines[i].replace(self.ARRAY_BEGIN, '')
-			if self.ARRAY_END in lines[i] and self.ARRAY_BEGIN not in lines[i]:
-				lines[i] = lines[i].replace(self.ARRAY_END, '')
-			if self.ARRAY_BEGIN not in lines[i]:
-				lines[i] = re.sub(r'([^\\])&', r'\1', lines[i])
+				if self.ARRAY_BEGIN in text and self.ARRAY_END not in text:
+					text = text.replace(self.ARRAY_BEGIN, '')
+				if self.ARRAY_END in text and self.ARRAY_BEGIN not in text:
+					text = text.replace(self.ARRAY_END, '')
+				if self.ARRAY_BEGIN not in text:
+					text = self.ALIGNMENT.sub(r'\1', text)
 
-		lines = [self.fix_syntax(line) for line in lines]
-		return lines
+				yield self.fix_syntax(text)
 
 	def clean_mix_output(self, text: str) -> list[str]:
 		text = self.assign_math(text)
-		sanitised = [
-			text  #
+		return [
+			sanitised  #
 			for line in self.split(text)
-			for text in self.process_line(line)
+			for sanitised in self.process_line(line)
+			if sanitised not in self.EMPTY
 		]
-
-		sanitised = filter(lambda x: x not in self.EMPTY, sanitised)
-		return list(sanitised)
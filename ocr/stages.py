@@ -0,0 +1,61 @@
+import cProfile
+import marshal
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+local = threading.local()
+
+# Only one profiler can be active in a process on Python 3.12+, profiled jobs take turns
+profile_lock = threading.Lock()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+	start = time.perf_counter()
+	try:
+		yield
+	finally:
+		timings = getattr(local, 'timings', None)
+		if timings is not None:
+			timings.append((name, time.perf_counter() - start))
+
+
+@contextmanager
+def collect() -> Iterator[list[tuple[str, float]]]:
+	# Stages are only recorded inside collect, and nested collects keep their own list
+	previous = getattr(local, 'timings', None)
+	local.timings = []
+	try:
+		yield local.timings
+	finally:
+		local.timings = previous
+
+
+def run_timed(fn: Callable, *args):
+	# Runs in the worker, the timings travel back with the result even across processes
+	with collect() as timings:
+		result = fn(*args)
+	return result, timings
+
+
+def run_profiled(fn: Callable, *args):
+	# Same as run_timed under cProfile, the stats are marshalled so they can be sent back from a process worker
+	with profile_lock:
+		profiler = cProfile.Profile()
+		try:
+			profiler.enable()
+		except ValueError:
+			# Another profiling tool, such as a debugger, holds the profiler, keep only the stage timings
+			result, timings = run_timed(fn, *args)
+			return result, timings, None
+
+		with collect() as timings:
+			try:
+				result = fn(*args)
+			finally:
+				profiler.disable()
+
+	profiler.create_stats()
+	return result, timings, marshal.dumps(profiler.stats)
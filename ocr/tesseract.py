@@ -1,17 +1,34 @@
 import json
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import count, repeat
 from pathlib import Path
+from typing import Iterator
 
 import pytesseract
 from PIL.Image import Image as ImageType
 
+from ocr.stages import stage
+
+try:
+	import tesserocr
+except ImportError:
+	tesserocr = None
+
 FILE_DIR = Path(__file__).resolve().parent
 BASE_DIR = FILE_DIR.parent
+POOL_SIZE = min(4, os.cpu_count() or 1)
 
 
 class Settings:
 	TESSERACT_PATH: str
+	TESSDATA_PATH: str | None = None
 	TIMEOUT: int
 	LANG: str
+	MAX_WORKERS: int = POOL_SIZE
 	DATATYPES = {
 		'int': int,
 		'float': float,
@@ -45,14 +62,116 @@ class Settings:
 				setattr(self, key, value)
 
 
-def analyse_tesseract(settings: Settings, images: list[ImageType] | ImageType):
+class TesseractError(Exception):
+	def __init__(self, index: int, error: Exception):
+		super().__init__(f'Image {index} failed: {error}')
+		self.index = index
+		self.error = error
+
+
+class TesseractPool:
+	def __init__(self, lang: str, tessdata_path: str | None = None, size: int = POOL_SIZE):
+		self.lang = lang
+		self.tessdata_path = tessdata_path
+		self.size = size
+		self.engines: queue.Queue = queue.Queue()
+		self.created = 0
+		self.lock = threading.Lock()
+
+	def create_engine(self) -> 'tesserocr.PyTessBaseAPI':
+		if self.tessdata_path is None:
+			return tesserocr.PyTessBaseAPI(lang=self.lang)
+		return tesserocr.PyTessBaseAPI(path=str(self.tessdata_path), lang=self.lang)
+
+	@contextmanager
+	def engine(self) -> Iterator['tesserocr.PyTessBaseAPI']:
+		# Engines are created on demand up to the pool size, then reused so traineddata is only loaded once
+		try:
+			engine = self.engines.get_nowait()
+		except queue.Empty:
+			with self.lock:
+				create = self.created < self.size
+				if create:
+					self.created += 1
+
+			if create:
+				try:
+					engine = self.create_engine()
+				except Exception:
+					with self.lock:
+						self.created -= 1
+					raise
+			else:
+				engine = self.engines.get()
+
+		try:
+			yield engine
+		finally:
+			self.engines.put(engine)
+
+	def recognise(self, image: ImageType, timeout: float = 0) -> str:
+		with self.engine() as engine:
+			engine.SetImage(image)
+
+			# Recognise takes milliseconds and gives up once it runs out, leaving the engine reusable
+			if not engine.Recognize(int(timeout * 1000)):
+				raise TimeoutError('Tesseract recognition timeout')
+
+			return engine.GetUTF8Text()
+
+
+pools: dict[tuple[str, str | None], TesseractPool] = {}
+pools_lock = threading.Lock()
+
+
+def get_pool(settings: Settings) -> TesseractPool:
+	key = (settings.LANG, settings.TESSDATA_PATH)
+
+	with pools_lock:
+		if key not in pools:
+			pools[key] = TesseractPool(settings.LANG, settings.TESSDATA_PATH, settings.MAX_WORKERS)
+		return pools[key]
+
+
+executors: dict[int, ThreadPoolExecutor] = {}
+executors_lock = threading.Lock()
+
+
+def get_executor(max_workers: int) -> ThreadPoolExecutor:
+	# Kept for the life of the process, so a list of images does not start and join new threads on every call
+	with executors_lock:
+		if max_workers not in executors:
+			executors[max_workers] = ThreadPoolExecutor(max_workers, thread_name_prefix='tesseract')
+		return executors[max_workers]
+
+
+def recognise(settings: Settings, image: ImageType) -> str:
+	# libtesseract reads the image from memory, the command line fallback goes through a temporary file
+	with stage('tesseract'):
+		if tesserocr is not None:
+			return get_pool(settings).recognise(image, settings.TIMEOUT)
+
+		return pytesseract.image_to_string(image, timeout=settings.TIMEOUT, lang=settings.LANG)
+
+
+def try_recognise(settings: Settings, index: int, image: ImageType) -> str | TesseractError:
+	try:
+		return recognise(settings, image)
+	except Exception as error:
+		return TesseractError(index, error)
+
+
+def analyse_tesseract(
+	settings: Settings,
+	images: list[ImageType] | ImageType,
+) -> list[str] | list[str | TesseractError]:
 	pytesseract.pytesseract.tesseract_cmd = settings.TESSERACT_PATH
 
+	# A single image raises as before, a list reports failed images in place so the rest are kept
 	if not isinstance(images, list):
-		images = [images]
+		return [recognise(settings, images)]
 
-	output = []
-	for image in images:
-		output.append(pytesseract.image_to_string(image, timeout=settings.TIMEOUT, lang=settings.LANG))
+	if len(images) <= 1 or settings.MAX_WORKERS <= 1:
+		return [try_recognise(settings, index, image) for index, image in enumerate(images)]
 
-	return output
+	return list(get_executor(settings.MAX_WORKERS).map(try_recognise, repeat(settings), count(), images))
@@ -0,0 +1,50 @@
+import unittest
+
+from PIL import Image, ImageDraw
+
+from backend.image_operation import scale_to_text_height, split_tiles
+
+
+def generate_lines(width: int, line_height: int, lines: int) -> Image.Image:
+	image = Image.new('RGB', (width, line_height * 2 * lines + line_height), (255, 255, 255))
+	draw = ImageDraw.Draw(image)
+
+	for line in range(lines):
+		top = line_height * (2 * line + 1)
+		draw.rectangle((width // 10, top, width * 9 // 10, top + line_height - 1), fill=(20, 20, 20))
+
+	return image
+
+
+class ScaleToTextHeightTest(unittest.TestCase):
+	def test_keeps_formula_snippet(self):
+		# A single formula, cropped to its height, used to be shrunk down to the target line height
+		image = generate_lines(600, 120, 1).crop((0, 120, 600, 240))
+		self.assertEqual(scale_to_text_height(image, 40).size, image.size)
+
+	def test_keeps_few_lines(self):
+		image = generate_lines(600, 120, 2)
+		self.assertEqual(scale_to_text_height(image, 40).size, image.size)
+
+	def test_shrinks_page(self):
+		image = generate_lines(1200, 120, 8)
+		self.assertEqual(scale_to_text_height(image, 40).size, (400, 680))
+
+	def test_keeps_small_text(self):
+		image = generate_lines(1200, 40, 8)
+		self.assertEqual(scale_to_text_height(image, 40).size, image.size)
+
+
+class SplitTilesTest(unittest.TestCase):
+	def test_joins_back_to_image(self):
+		image = generate_lines(200, 30, 40)
+
+		for margin in [0, 16, 64]:
+			tiles = split_tiles(image, 500, margin)
+			self.assertGreater(len(tiles), 1)
+			self.assertEqual(sum(tile.height for tile in tiles), image.height)
+			self.assertTrue(all(tile.height <= 500 + margin for tile in tiles))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,234 @@
+import math
+import random
+import re
+import unittest
+
+from ocr.sanitiser import Sanitiser
+
+MIX_TOKENS = ['$', '$$', r'\$', 'a', 'x^2', ' ', '\n', '{', '}', r'\left(', r'\right)', r'\\', '&', r'\begin{matrix}', r'\end{matrix}']
+TOKENS = ['{', '}', r'\left', r'\right', r'\{', r'\}', r'\left(', r'\right)', r'\textcircled', 'x', ' ', '^', r'\\']
+
+
+def reference_fix_syntax(text: str) -> str:
+	# fix_syntax before it was rewritten as a tokenizer, kept to check the rewrite returns the same output
+	cleaned_text = ''
+	syntax_stack = []
+
+	i = 0
+	line_length = len(text)
+	while i < line_length:
+		sliced = text[i:]
+
+		# Correct closer syntax
+		if len(syntax_stack) > 0 and sliced.startswith(syntax_stack[-1]):
+			add = syntax_stack.pop()
+			cleaned_text += add
+			i += len(add)
+			continue
+
+		# Have unclosed syntax, also close them first
+		is_closer = False
+		temp_stack = []
+		for j in range(len(syntax_stack) - 1, -1, -1):
+			temp_stack.append(syntax_stack[j])
+			if sliced.startswith(syntax_stack[j]):
+				is_closer = True
+				break
+
+		if is_closer:
+			for k in range(len(temp_stack) - 1):
+				if temp_stack[k] in Sanitiser.UNCLOSED_REPLACE:
+					temp_stack[k] = Sanitiser.UNCLOSED_REPLACE[temp_stack[k]]
+
+			cleaned_text += ' '.join(temp_stack)
+			i += len(temp_stack[-1])
+			syntax_stack = syntax_stack[0:j]
+			continue
+
+		# Closer syntax without opener, skip it
+		is_closer = False
+		for closer in Sanitiser.SYNTAX.values():
+			if sliced.startswith(closer):
+				is_closer = True
+				i += len(closer)
+				break
+
+		if is_closer:
+			continue
+
+		# Record syntax into stack
+		is_syntax = False
+		for opener, closer in Sanitiser.SYNTAX.items():
+			if sliced.startswith(opener):
+				cleaned_text += opener
+				syntax_stack.append(closer)
+				is_syntax = True
+				i += len(opener)
+				break
+
+		if is_syntax:
+			continue
+
+		# If not syntax, find location of the next syntax
+		next_index = math.inf
+		for opener, closer in Sanitiser.SYNTAX.items():
+			for search_text in [opener, closer]:
+				matched = re.search(r'[^\\]' + re.escape(search_text), sliced)
+				if matched is not None:
+					next_index = min(matched.start() + 1, next_index)
+
+		# The old version sliced with math.inf here and raised, the rest of the text is plain
+		if next_index == math.inf:
+			next_index = len(sliced)
+
+		cleaned_text += sliced[0:next_index]
+		i += next_index
+
+	# Close all unclosed syntax
+	for unclosed in syntax_stack[::-1]:
+		unclosed = Sanitiser.UNCLOSED_REPLACE.get(unclosed, unclosed)
+		cleaned_text = cleaned_text.replace(Sanitiser.MATH_END, f'{unclosed} {Sanitiser.MATH_END}')
+
+	# Remove unrecognised syntax
+	for unrecognised in Sanitiser.UNRECOGNISED:
+		cleaned_text = cleaned_text.replace(unrecognised, '')
+
+	return cleaned_text
+
+
+def reference_assign_math(text: str) -> str:
+	# assign_math before it was rewritten as a single pass, every run of $ toggled the math environment
+	math = [Sanitiser.MATH_BEGIN, Sanitiser.MATH_END]
+	math_open = 0
+	while Sanitiser.MATH_CHECKER in text:
+		text = re.sub(rf'\{Sanitiser.MATH_CHECKER}+', rf'\{math[math_open]}', text, 1)
+		math_open ^= 1
+	return text
+
+
+def reference_clean_mix_output(text: str) -> list[str]:
+	# clean_mix_output and its helpers before the rewrite
+	text = reference_assign_math(text)
+
+	splitted = text.split(Sanitiser.MATH_END)
+	for i in range(len(splitted) - 1):
+		splitted[i] += Sanitiser.MATH_END
+
+	splitted = [split.split(Sanitiser.MATH_BEGIN) for split in splitted if split != '']
+	for i in range(len(splitted)):
+		for j in range(1, len(splitted[i])):
+			splitted[i][j] = Sanitiser.MATH_BEGIN + splitted[i][j]
+
+	sanitised = []
+	for line in (x for split in splitted for x in split if x not in Sanitiser.EMPTY):
+		if Sanitiser.MATH_BEGIN not in line:
+			sanitised.extend(line.splitlines())
+			continue
+
+		lines = [
+			re.sub(rf'(\{Sanitiser.MATRIX_BEGIN}|\{Sanitiser.MATRIX_END})', '', text)
+			for row in line.splitlines()
+			for text in row.split(Sanitiser.MATRIX_NEWLINE)
+		]
+
+		for i in range(len(lines)):
+			if not lines[i].startswith(Sanitiser.MATH_BEGIN):
+				lines[i] = Sanitiser.MATH_BEGIN + lines[i]
+			if not lines[i].endswith(Sanitiser.MATH_END):
+				lines[i] += Sanitiser.MATH_END
+
+			if Sanitiser.ARRAY_BEGIN in lines[i] and Sanitiser.ARRAY_END not in lines[i]:
+				lines[i] = lines[i].replace(Sanitiser.ARRAY_BEGIN, '')
+			if Sanitiser.ARRAY_END in lines[i] and Sanitiser.ARRAY_BEGIN not in lines[i]:
+				lines[i] = lines[i].replace(Sanitiser.ARRAY_END, '')
+			if Sanitiser.ARRAY_BEGIN not in lines[i]:
+				lines[i] = re.sub(r'([^\\])&', r'\1', lines[i])
+
+		sanitised.extend(reference_fix_syntax(line) for line in lines)
+
+	return [line for line in sanitised if line not in Sanitiser.EMPTY]
+
+
+def generate_mix(generator: random.Random, length: int) -> str:
+	# Runs of three or more $ are read differently since the rewrite, they are tested on their own
+	while True:
+		text = ''.join(generator.choices(MIX_TOKENS, k=length))
+		if '$$$' not in text:
+			return text
+
+
+def generate_math(generator: random.Random, length: int) -> str:
+	return Sanitiser.MATH_BEGIN + ''.join(generator.choices(TOKENS, k=length)) + Sanitiser.MATH_END
+
+
+class FixSyntaxTest(unittest.TestCase):
+	def setUp(self):
+		self.sanitiser = Sanitiser()
+
+	def test_matches_reference(self):
+		generator = random.Random(0)
+
+		for _ in range(20000):
+			text = generate_math(generator, generator.randint(0, 30))
+			self.assertEqual(self.sanitiser.fix_syntax(text), reference_fix_syntax(text), text)
+
+	def test_matches_reference_on_long_lines(self):
+		generator = random.Random(1)
+
+		for _ in range(50):
+			text = generate_math(generator, generator.randint(100, 1000))
+			self.assertEqual(self.sanitiser.fix_syntax(text), reference_fix_syntax(text), text)
+
+	def test_closes_unclosed_syntax(self):
+		text = rf'{Sanitiser.MATH_BEGIN}\left( {{x + \right){Sanitiser.MATH_END}'
+		self.assertEqual(self.sanitiser.fix_syntax(text), rf'{Sanitiser.MATH_BEGIN}\left( {{x + }} \right){Sanitiser.MATH_END}')
+
+	def test_linear_on_deep_nesting(self):
+		# Used to search the whole stack for every closer, this took tens of seconds
+		depth = 100000
+		text = Sanitiser.MATH_BEGIN + '{' * depth + r'\right' * depth + Sanitiser.MATH_END
+		self.assertTrue(self.sanitiser.fix_syntax(text).endswith(' '.join(['}'] * depth) + ' ' + Sanitiser.MATH_END))
+
+
+
+class CleanMixOutputTest(unittest.TestCase):
+	def setUp(self):
+		self.sanitiser = Sanitiser()
+
+	def test_assign_math_matches_reference(self):
+		generator = random.Random(2)
+
+		for _ in range(20000):
+			text = generate_mix(generator, generator.randint(0, 20))
+			self.assertEqual(self.sanitiser.assign_math(text), reference_assign_math(text), text)
+
+	def test_matches_reference(self):
+		generator = random.Random(3)
+
+		for _ in range(20000):
+			text = generate_mix(generator, generator.randint(0, 20))
+			self.assertEqual(self.sanitiser.clean_mix_output(text), reference_clean_mix_output(text), text)
+
+	def test_display_math(self):
+		# Display math is still output as inline math
+		self.assertEqual(
+			self.sanitiser.clean_mix_output('Let $$x^2$$ be $y$'),
+			['Let ', rf'{Sanitiser.MATH_BEGIN}x^2{Sanitiser.MATH_END}', ' be ', rf'{Sanitiser.MATH_BEGIN}y{Sanitiser.MATH_END}'],
+		)
+
+	def test_adjacent_display_math(self):
+		# Used to be read as one delimiter, which swapped the text and math after it
+		self.assertEqual(
+			self.sanitiser.clean_mix_output('$$a$$$$b$$ c'),
+			[f'{Sanitiser.MATH_BEGIN}a{Sanitiser.MATH_END}', f'{Sanitiser.MATH_BEGIN}b{Sanitiser.MATH_END}', ' c'],
+		)
+
+	def test_escaped_dollar(self):
+		# An escaped $ still toggles math, the same as before the rewrite
+		text = r'costs \$5 and $x$'
+		self.assertEqual(self.sanitiser.assign_math(text), reference_assign_math(text))
+		self.assertEqual(self.sanitiser.clean_mix_output(text), reference_clean_mix_output(text))
+
+
+if __name__ == '__main__':
+	unittest.main()
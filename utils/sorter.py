@@ -1,56 +1,39 @@
-from functools import cmp_to_key
-from pathlib import Path
+import os
 import re
+from pathlib import Path
+from typing import Iterable
 
-class Sorter:
-	@cmp_to_key
-	@staticmethod
-	def compare_path(parts_1: list[str], parts_2: list[str]) -> int:
-		parts_1 = parts_1[1]
-		parts_2 = parts_2[1]
-		len_1 = len(parts_1)
-		len_2 = len(parts_2)
-
-		for i in range(min(len_1, len_2)):
-			is_float_1 = isinstance(parts_1[i], float)
-			is_float_2 = isinstance(parts_2[i], float)
+NATURAL_PARTS = re.compile(r'(\d+\.\d+|\d+)|([^\d]+)')
 
-			if is_float_1 and is_float_2:
-				# If same number, check next part
-				if parts_1[i] == parts_2[i]:
-					continue
+# Sorts after every number and string, so a name that runs out of parts sorts after a longer one sharing its parts
+END_OF_NAME = (2,)
 
-				# If not same, just compare that
-				else:
-					return parts_1[i] - parts_2[i]
 
-			# If only one is numeric, numeric first
-			elif is_float_1:
-				return -1
-			elif is_float_2:
-				return 1
+class Sorter:
+	@staticmethod
+	def natural_key(name: str) -> tuple[tuple, ...]:
+		# Numbers sort before strings, numbers by value and strings as they are
+		return (
+			*((0, float(number), '') if number else (1, 0, text) for number, text in NATURAL_PARTS.findall(name)),
+			END_OF_NAME,
+		)
 
-			# Else compare string if not same
-			elif parts_1[i] != parts_2[i]:
-				return 1 if parts_1[i] > parts_2[i] else -1
+	@staticmethod
+	def path_key(path: Path) -> tuple[tuple, ...]:
+		return Sorter.natural_key(path.stem)
 
-		return len_2 - len_1
+	@staticmethod
+	def entry_key(entry: os.DirEntry) -> tuple[tuple, ...]:
+		# Same as the stem of a path, without building a Path for every entry
+		return Sorter.natural_key(os.path.splitext(entry.name)[0])
 
 	@staticmethod
 	def sort_paths(paths: list[Path]) -> list[Path]:
-		stems = []
-
-		for path in paths:
-			stem = path.stem
-			parts = re.findall(r'(\d+\.\d+|\d+|[^\d+]+)', stem)
+		return sorted(paths, key=Sorter.path_key)
 
-			for i in range(len(parts)):
-				try:
-					parts[i] = float(parts[i])
-				except ValueError:
-					pass
-
-			stems.append([path, parts])
-
-		stems = [stem[0] for stem in sorted(stems, key=Sorter.compare_path)]
-		return stems
+	@staticmethod
+	def sort_entries(entries: Iterable[os.DirEntry]) -> list[os.DirEntry]:
+		# Keys are worked out while os.scandir is still listing, the iterator is never copied into a list first
+		keyed = [(Sorter.entry_key(entry), index, entry) for index, entry in enumerate(entries)]
+		keyed.sort()
+		return [entry for _, _, entry in keyed]